@@ -0,0 +1,4 @@
+import logging
+
+# Whatever pyro logs is only shown if the application configures logging
+logging.getLogger(__name__).addHandler(logging.NullHandler())
@@ -0,0 +1,327 @@
+"""Benchmarks for the engine's hot paths.
+
+Each benchmark runs on generated maps of several sizes and monster
+densities, and the results are written as JSON so that runs can be compared
+with each other:
+
+    python -m pyro.benchmark --output results.json
+    python -m pyro.benchmark --baseline results.json
+
+With --baseline, any benchmark that got slower than the baseline by more
+than the tolerance is reported and the exit status is non-zero. The maps
+are generated from a fixed seed and their checksums are part of the
+results, so a baseline measured on other maps is pointed out. So is
+importing any of the STARTUP_MODULES taking longer than --import-budget.
+
+GameScreen.render needs a root console, and therefore a display, so it is
+only measured when --render is given. Like the game itself, this must be run
+from the repository root so that the resources can be found.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import timeit
+import zlib
+import libtcodpy as libtcod
+import pyro.astar
+from pyro import objects
+from pyro.direction import Direction
+from pyro.engine.actions import WalkAction
+from pyro.engine.game import Game
+from pyro.engine.log import _format
+from pyro.map import make_map
+from pyro.position import Position
+from pyro.savegame import dumps
+from pyro.settings import MAP_WIDTH, MAP_HEIGHT, MAX_ROOMS, PANEL_HEIGHT, SCREEN_HEIGHT, SCREEN_WIDTH
+
+
+# Map sizes as multiples of the regular map size
+SIZES = [1, 2, 3]
+
+# Extra monsters added to each generated map
+DENSITIES = [0, 30, 100]
+
+# Every map is generated from this seed, through the game's seed, so that
+# every run measures the very same maps
+SEED = 1234
+
+# Modules that processes start from, and the time (in seconds) importing
+# each of them may take
+STARTUP_MODULES = ['pyro.main', 'pyro.headless']
+IMPORT_BUDGET = 0.5
+
+
+class Result:
+    def __init__(self, name, params, timings, iterations):
+        """Timings are the total seconds for each repeat of the iterations."""
+        self.name = name
+        self.params = params
+        self.iterations = iterations
+        per_call = [t / iterations for t in timings]
+        self.best = min(per_call)
+        self.mean = sum(per_call) / len(per_call)
+        self.worst = max(per_call)
+
+    @property
+    def key(self):
+        params = ','.join('%s=%s' % (k, self.params[k]) for k in sorted(self.params))
+        return '%s[%s]' % (self.name, params)
+
+    def to_json(self):
+        return dict(name=self.name, params=self.params, iterations=self.iterations,
+                    best=self.best, mean=self.mean, worst=self.worst)
+
+
+def _measure(name, params, fn, iterations, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = timeit.default_timer()
+        for _ in range(iterations):
+            fn()
+        timings.append(timeit.default_timer() - start)
+    return Result(name, params, timings, iterations)
+
+
+def _new_game(size, monsters=0):
+    game = Game(dungeon_level=1, seed=SEED)
+    objects.new_player(game)
+    make_map(game, MAP_WIDTH * size, MAP_HEIGHT * size, MAX_ROOMS * size * size)
+
+    # Keep the hero alive however long the benchmark runs
+    game.player.hp = game.player.base_max_hp = 10 ** 9
+
+    _add_monsters(game, monsters)
+    return game
+
+
+def maps_fingerprint():
+    """Returns a checksum of the map of each size and what is on it, which
+    only matches another run's if both measured the same maps."""
+    fingerprints = {}
+    for size in SIZES:
+        game = _new_game(size)
+        stage = game.stage
+        layout = [(actor.pos.x, actor.pos.y) for actor in stage.actors]
+        layout += [(item.pos.x, item.pos.y) for item in stage.items]
+        fingerprints[str(size)] = zlib.crc32(stage.map.types.tostring() + repr(layout)) & 0xFFFFFFFF
+    return fingerprints
+
+
+def _add_monsters(game, count):
+    """Adds monsters on free cells, nearest to the hero first so that they
+    are all in view and chasing."""
+    game_map = game.stage.map
+    hero = game.player.pos
+    free = [Position(x, y)
+            for y in range(game_map.height)
+            for x in range(game_map.width)
+            if not game_map.movement_blocked(x, y)]
+    free.sort(key=hero.distance_to)
+    for position in free:
+        if count == 0:
+            break
+        if game.stage.actor_at(position):
+            continue
+        monster = objects.new_monster(game, 'monster.orc', position)
+        game.stage.add_actor(monster)
+        count -= 1
+
+
+def bench_make_map(size, repeat):
+    game = _new_game(size)
+    width, height, rooms = MAP_WIDTH * size, MAP_HEIGHT * size, MAX_ROOMS * size * size
+    return _measure('make_map', dict(size=size),
+                    lambda: make_map(game, width, height, rooms), 5, repeat)
+
+
+def bench_refresh_visibility(size, repeat):
+    game = _new_game(size)
+    game_map = game.stage.map
+    hero = game.player.pos
+
+    def refresh():
+        game_map.dirty_visibility()
+        game_map.refresh_visibility(hero)
+
+    return _measure('refresh_visibility', dict(size=size), refresh, 100, repeat)
+
+
+def bench_astar(size, monsters, repeat):
+    game = _new_game(size, monsters)
+    hero = game.player
+    chasers = [actor for actor in game.stage.actors if actor != hero]
+
+    def search():
+        for monster in chasers:
+            pyro.astar.astar(game, monster.pos, hero.pos)
+
+    return _measure('astar', dict(size=size, monsters=monsters), search, 5, repeat)
+
+
+def bench_turn(size, monsters, repeat):
+    game = _new_game(size, monsters)
+    hero = game.player
+
+    def turn():
+        hero.next_action = WalkAction(Direction.NONE)
+        game.update()
+        while not (hero.energy.can_take_turn() and hero.needs_input()):
+            game.update()
+
+    return _measure('turn', dict(size=size, monsters=monsters), turn, 20, repeat)
+
+
+def bench_save(size, monsters, repeat):
+    game = _new_game(size, monsters)
+    return _measure('save', dict(size=size, monsters=monsters), lambda: dumps(game), 20, repeat)
+
+
+def bench_log_format(repeat):
+    game = _new_game(1, 1)
+    hero = game.player
+    monster = game.stage.actors[1]
+    messages = [
+        ('{1} attack[s] {2} for 4 damage!', hero, monster),
+        ('{1} attack[s] {2} but miss[es]!', monster, hero),
+        ('{1} [are|is] no longer confused!', monster, None),
+        ('The eyes of {1} look vacant as {2 he} stumbles around!', monster, monster),
+        ("{1} [don't|doesn't] feel any different.", hero, None),
+    ]
+
+    def format_all():
+        for text, noun1, noun2 in messages:
+            _format(text, noun1, noun2)
+
+    return _measure('log_format', dict(messages=len(messages)), format_all, 2000, repeat)
+
+
+def bench_import(module, repeat):
+    """Times importing the module in a new interpreter, as when a process
+    starts."""
+    code = ('import timeit; start = timeit.default_timer(); import %s; '
+            'print(timeit.default_timer() - start)' % module)
+    timings = [float(subprocess.check_output([sys.executable, '-c', code]))
+               for _ in range(repeat)]
+    return Result('import', dict(module=module), timings, 1)
+
+
+class _RenderUI:
+    """Just enough of a UserInterface for GameScreen to render into."""
+    def __init__(self, game):
+        self.console = libtcod.console_new(game.stage.map.width, game.stage.map.height)
+        self.panel = libtcod.console_new(SCREEN_WIDTH, PANEL_HEIGHT)
+        self.mouse = libtcod.Mouse()
+
+    def dirty(self, reason=None):
+        pass
+
+
+def bench_render(size, monsters, repeat, full):
+    """Times a frame where nothing changed, or a redraw of the whole map."""
+    from pyro.ui.game_screen import GameScreen
+    game = _new_game(size, monsters)
+    screen = GameScreen(game, pregenerate=False)
+    screen.bind(_RenderUI(game))
+
+    def render():
+        if full:
+            screen.redraw()
+        screen.render()
+
+    return _measure('render', dict(size=size, monsters=monsters, full=full), render, 20, repeat)
+
+
+def run(repeat=3, render=False):
+    results = [bench_import(module, repeat) for module in STARTUP_MODULES]
+    for size in SIZES:
+        results.append(bench_make_map(size, repeat))
+        results.append(bench_refresh_visibility(size, repeat))
+        for monsters in DENSITIES:
+            results.append(bench_astar(size, monsters, repeat))
+            results.append(bench_turn(size, monsters, repeat))
+            results.append(bench_save(size, monsters, repeat))
+            if render:
+                results.append(bench_render(size, monsters, repeat, False))
+                results.append(bench_render(size, monsters, repeat, True))
+    results.append(bench_log_format(repeat))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Returns a message for every result slower than its baseline by more
+    than the tolerance (e.g. 0.2 for 20%)."""
+    previous = {}
+    for entry in baseline['results']:
+        params = ','.join('%s=%s' % (k, entry['params'][k]) for k in sorted(entry['params']))
+        previous['%s[%s]' % (entry['name'], params)] = entry['best']
+
+    regressions = []
+    for result in results:
+        before = previous.get(result.key)
+        if before and result.best > before * (1 + tolerance):
+            regressions.append('%s: %.3fms -> %.3fms (%+.0f%%)' % (
+                result.key, before * 1000, result.best * 1000,
+                (result.best / before - 1) * 100))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the engine hot paths.')
+    parser.add_argument('--output', help='file to write the JSON results to')
+    parser.add_argument('--baseline', help='JSON results of a previous run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='slowdown allowed before a regression is reported')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='times to repeat each benchmark; the best is kept')
+    parser.add_argument('--render', action='store_true',
+                        help='also benchmark rendering (needs a display)')
+    parser.add_argument('--import-budget', type=float, default=IMPORT_BUDGET,
+                        help='seconds that importing a startup module may take')
+    args = parser.parse_args()
+
+    if args.render:
+        libtcod.console_init_root(SCREEN_WIDTH, SCREEN_HEIGHT, 'pyro benchmark', False)
+
+    results = run(args.repeat, args.render)
+    for result in results:
+        print('%-50s %10.3fms' % (result.key, result.best * 1000))
+
+    report = dict(
+        seed=SEED,
+        maps=maps_fingerprint(),
+        time=time.time(),
+        python=platform.python_version(),
+        platform=platform.platform(),
+        results=[result.to_json() for result in results],
+    )
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    failed = False
+    for result in results:
+        if result.name == 'import' and result.best > args.import_budget:
+            print('OVER BUDGET %s: %.3fs' % (result.key, result.best))
+            failed = True
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('maps') != report['maps']:
+            # Timings of different maps say little about each other
+            print('WARNING the baseline was measured on other maps')
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print('REGRESSION ' + regression)
+        if regressions:
+            failed = True
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,4 @@
-import random as librand
+import libtcodpy as libtcod
 
 
 class Direction:
@@ -40,5 +40,5 @@ def from_vector(x, y):
     return Direction.NONE
 
 
-def random():
-    return librand.choice(Direction.ALL)
+def random(rng=0):
+    return Direction.ALL[libtcod.random_get_int(rng, 0, len(Direction.ALL) - 1)]
@@ -25,8 +25,9 @@ class PickUpAction(ItemAction):
         else:
             self.item.owner = owner
             owner.inventory.append(self.item)
+            owner.equipment_changed()
             if self.item in self.game.stage.items:
-                self.game.stage.items.remove(self.item)
+                self.game.stage.remove_item(self.item)
             return self.succeed('{1} pick[s] up {2}.', self.actor, self.item)
 
 
@@ -39,14 +40,15 @@ class DropAction(ItemAction):
         """Assumes only the player can drop items."""
         # TODO Add support for stacks of items
         self.item.owner.inventory.remove(self.item)
-        self.game.stage.items.append(self.item)
         self.item.pos.copy(self.item.owner.pos)
+        self.game.stage.add_item(self.item)
 
         if self.item.is_equipped:
             self.item.is_equipped = False
             message = '{1} take[s] off and drop[s] {2}.'
         else:
             message = '{1} drop[s] {2}.'
+        self.item.owner.equipment_changed()
         return self.succeed(message, self.actor, self.item)
 
 
@@ -90,6 +92,7 @@ class EquipAction(ItemAction):
             self.log('{1} unequip[s] {2}.', self.actor, replaced[0])
 
         self.item.is_equipped = True
+        self.item.owner.equipment_changed()
         return self.succeed('{1} equip[s] {2}.', self.actor, self.item)
 
 
@@ -100,4 +103,5 @@ class UnequipAction(ItemAction):
 
     def on_perform(self):
         self.item.is_equipped = False
+        self.item.owner.equipment_changed()
         return self.succeed('{1} unequip[s] {2}.', self.actor, self.item)
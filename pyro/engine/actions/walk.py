@@ -16,30 +16,25 @@ class WalkAction(Action):
 
         # See if there is an actor there
         new_pos = self.actor.pos.plus(self.direction)
-        target = None
-        for actor in self.game.stage.actors:
-            if actor.pos == new_pos:
-                target = actor
-                break
+        target = self.game.stage.actor_at(new_pos)
 
         if target and target != self.actor:
             return self.alternate(AttackAction(target))
 
         # See if it's a door
-        if self.game.stage.map.tile(new_pos).type.opens_to:
+        if self.game.stage.map.tile_type(new_pos).opens_to:
             return self.alternate(OpenDoorAction(new_pos))
 
         # Try moving there
         if blocked(self.game, new_pos):
             return ActionResult.FAILURE
 
-        self.actor.pos = new_pos
-        self.game.stage.map.dirty_visibility()
+        self.game.stage.move_actor(self.actor, new_pos)
 
         # Step on the tile (i.e. tall grass becomes crushed grass)
-        tile = self.game.stage.map.tile(new_pos)
-        if tile.type.steps_to:
-            tile.type = tile.type.steps_to
+        tile_type = self.game.stage.map.tile_type(new_pos)
+        if tile_type.steps_to:
+            self.game.stage.map.set_tile_type(new_pos, tile_type.steps_to)
 
         return ActionResult.SUCCESS
 
@@ -50,9 +45,8 @@ class OpenDoorAction(Action):
         self.position = position
 
     def on_perform(self):
-        tile = self.game.stage.map.tile(self.position)
-        tile.type = tile.type.opens_to
-        self.game.stage.map.dirty_visibility()
+        tile_type = self.game.stage.map.tile_type(self.position)
+        self.game.stage.map.set_tile_type(self.position, tile_type.opens_to)
         return ActionResult.SUCCESS
 
 
@@ -64,10 +58,9 @@ class CloseDoorAction(Action):
     def on_perform(self):
         for direction in Direction.ALL:
             pos = self.position.plus(direction)
-            tile = self.game.stage.map.tile(pos)
-            if tile.type.closes_to:
+            tile_type = self.game.stage.map.tile_type(pos)
+            if tile_type.closes_to:
                 if not blocked(self.game, pos):
-                    tile.type = tile.type.closes_to
-                    self.game.stage.map.dirty_visibility()
+                    self.game.stage.map.set_tile_type(pos, tile_type.closes_to)
                     break
         return ActionResult.SUCCESS
@@ -19,6 +19,7 @@ class Actor(Noun):
         self.xp = 0
         self.level = 1
         self.inventory = None
+        self._equipment_bonuses = None
 
     @property
     def pos(self):
@@ -61,29 +62,35 @@ class Actor(Noun):
     def on_modify_hit(self, hit):
         pass
 
+    def equipment_changed(self):
+        """Must be called whenever an item is equipped, unequipped, or added
+        to or removed from the inventory."""
+        self._equipment_bonuses = None
+
+    def _bonuses(self):
+        """Returns the (power, defense, max_hp) bonuses of the equipped items."""
+        if self._equipment_bonuses is None:
+            power = defense = max_hp = 0
+            if self.inventory:
+                for equipment in self.inventory:
+                    if equipment.is_equipped:
+                        power += equipment.power_bonus
+                        defense += equipment.defense_bonus
+                        max_hp += equipment.max_hp_bonus
+            self._equipment_bonuses = (power, defense, max_hp)
+        return self._equipment_bonuses
+
     @property
     def power(self):
-        bonus = 0
-        if self.inventory:
-            equipped = filter(lambda i: i.is_equipped, self.inventory)
-            bonus = sum(equipment.power_bonus for equipment in equipped)
-        return self.base_power + bonus
+        return self.base_power + self._bonuses()[0]
 
     @property
     def defense(self):
-        bonus = 0
-        if self.inventory:
-            equipped = filter(lambda i: i.is_equipped, self.inventory)
-            bonus = sum(equipment.defense_bonus for equipment in equipped)
-        return self.base_defense + bonus
+        return self.base_defense + self._bonuses()[1]
 
     @property
     def max_hp(self):
-        bonus = 0
-        if self.inventory:
-            equipped = filter(lambda i: i.is_equipped, self.inventory)
-            bonus = sum(equipment.max_hp_bonus for equipment in equipped)
-        return self.base_max_hp + bonus
+        return self.base_max_hp + self._bonuses()[2]
 
     def take_damage(self, action, damage, attacker):
         self.hp -= damage
@@ -35,6 +35,9 @@ class AI:
 
     def take_turn(self):
         """Perform a single game turn."""
+        profiler = self.monster.game.profiler
+        if profiler:
+            return profiler.call('ai.' + self.behavior.__class__.__name__, self.behavior.take_turn, self)
         return self.behavior.take_turn(self)
 
     def took_damage(self, action, damage, attacker):
@@ -59,7 +62,7 @@ class AI:
         if Spell.TYPE_ATTACK == spell.type:
             # TODO move hit chance and messaging into Spell.cast()
             # Only 40% chance to hit
-            if libtcod.random_get_int(0, 1, 5) <= 2:
+            if libtcod.random_get_int(self.monster.game.rng, 1, 5) <= 2:
                 self.monster.game.log.message('{1} casts a %s' %
                                               spell.name, self.monster)
                 return spell.cast(target)
@@ -71,6 +74,21 @@ class AI:
             return spell.cast(target)
 
 
+def _approach(monster, target):
+    """Returns the Direction the monster should walk to get to the target."""
+    game = monster.game
+    if target == game.player:
+        # Everyone chasing the hero shares the stage's distance map
+        args = (target.pos, monster.pos, game.stage.navigation.is_walkable, 25)
+        if game.profiler:
+            direction = game.profiler.call('pathfinding.distance', game.stage.distance_map.step_towards, *args)
+        else:
+            direction = game.stage.distance_map.step_towards(*args)
+        if direction:
+            return direction
+    return pyro.astar.astar(game, monster.pos, target.pos)
+
+
 class BehaviorStrategy:
     def take_turn(self, ai):
         pass
@@ -88,8 +106,7 @@ class Aggressive(BehaviorStrategy):
         if ai.monster.game.stage.map.is_in_fov(ai.monster.pos):
             # Move towards player if far away
             if ai.monster.pos.distance_to(target.pos) >= 2:
-                direction = pyro.astar.astar(ai.monster.game, ai.monster.pos, target.pos)
-                return WalkAction(direction)
+                return WalkAction(_approach(ai.monster, target))
 
             # Close enough, attack! (If the player is still alive)
             elif target.is_alive():
@@ -109,22 +126,21 @@ class AggressiveSpellcaster(BehaviorStrategy):
 
             # Move towards player if far away
             if not ai.in_range(player, Spell.TYPE_ATTACK):
-                direction = pyro.astar.astar(ai.monster.game, ai.monster.pos, player.pos)
-                return WalkAction(direction)
+                return WalkAction(_approach(ai.monster, player))
 
             # Close enough, attack! (If the player is still alive)
             elif player.is_alive():
                 attacks = ai.get_spells(Spell.TYPE_ATTACK)
                 if len(attacks) > 0:
-                    random_attack = attacks[libtcod.random_get_int(0, 0, len(attacks)-1)]
+                    random_attack = attacks[libtcod.random_get_int(ai.monster.game.rng, 0, len(attacks)-1)]
                     return ai.cast_spell(random_attack, player)
 
 
 class PassiveAggressive(BehaviorStrategy):
     def take_turn(self, ai):
         # 25% chance to move one square in a random direction
-        if libtcod.random_get_int(0, 1, 4) == 1:
-            direction = pyro.direction.random()
+        if libtcod.random_get_int(ai.monster.game.rng, 1, 4) == 1:
+            direction = pyro.direction.random(ai.monster.game.rng)
             if not blocked(ai.monster.game, ai.monster.pos.plus(direction)):
                 return WalkAction(direction)
 
@@ -142,7 +158,7 @@ class Confused(BehaviorStrategy):
         if self.restore_ai is None or self.num_turns > 0:
             self.num_turns -= 1
             # Move in a random direction
-            direction = pyro.direction.random()
+            direction = pyro.direction.random(ai.monster.game.rng)
             if not blocked(ai.monster.game, ai.monster.pos.plus(direction)):
                 return WalkAction(direction)
         else:
@@ -27,7 +27,7 @@ class Hit:
                 attack_verb = self._attack.verb
 
         if can_miss:
-            if libtcod.random_get_int(0, 1, 10) == 1:
+            if libtcod.random_get_int(attacker.game.rng, 1, 10) == 1:
                 action.log('{1} %s {2} but miss[es]!' % attack_verb, attack_noun, defender)
                 return
 
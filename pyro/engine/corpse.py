@@ -10,6 +10,9 @@ _CorpseType = namedtuple('CorpseType', 'glyph')
 _TYPE_MONSTER = _CorpseType(glyph('%', libtcod.dark_red))
 _TYPE_HERO = _CorpseType(glyph('%', libtcod.dark_red))
 
+# Every corpse type, by id, for saved games
+TYPES = [_TYPE_MONSTER, _TYPE_HERO]
+
 
 def for_monster(monster):
     name = 'Remains of {0}'.format(monster.name)
@@ -1,5 +1,10 @@
 from collections import deque
+import libtcodpy as libtcod
 from pyro.engine.log import Log
+from pyro.engine.scheduler import EnergyQueue
+from pyro.navigation import NavigationGrid, DistanceMap
+from pyro.settings import TURN_SCHEDULER
+from pyro.spatial import SpatialIndex
 
 
 class Stage:
@@ -9,53 +14,169 @@ class Stage:
         self.items = items if items else []
         self.corpses = []
         self.current_actor_index = 0
+        self.navigation = NavigationGrid(map_, self.actors) if map_ else None
+        self.distance_map = DistanceMap(map_) if map_ else None
+        self.actor_index = SpatialIndex(self.actors)
+        self.item_index = SpatialIndex(self.items)
+        self.corpse_index = SpatialIndex()
+        self.turn_queue = EnergyQueue(self.actors) if TURN_SCHEDULER == 'queue' else None
 
     def current_actor(self):
+        if self.turn_queue:
+            return self.turn_queue.current_actor()
         return self.actors[self.current_actor_index]
 
     def advance_actor(self):
+        if self.turn_queue:
+            self.turn_queue.advance_actor()
+            return
         self.current_actor_index = (self.current_actor_index + 1) % len(self.actors)
 
+    def add_actor(self, actor):
+        self.actors.append(actor)
+        self.actor_index.add(actor)
+        if self.turn_queue:
+            self.turn_queue.add(actor)
+        if self.navigation:
+            self.navigation.actor_added(actor.pos)
+
+    def add_hero(self, hero):
+        """Adds the hero to a stage that was built without it, ahead of
+        every other actor."""
+        self.actors.insert(0, hero)
+        self.actor_index.add(hero)
+        if self.turn_queue:
+            self.turn_queue = EnergyQueue(self.actors)
+        if self.navigation:
+            self.navigation.actor_added(hero.pos)
+
+    def actor_at(self, position):
+        actors = self.actor_index.at(position)
+        return actors[0] if actors else None
+
+    def move_actor(self, actor, position):
+        old_pos = actor.pos.clone()
+        actor.pos = position
+        self.actor_index.move(actor, old_pos)
+        if self.navigation:
+            self.navigation.actor_moved(old_pos, actor.pos)
+
     def remove_actor(self, actor):
         index = self.actors.index(actor)
-        if self.current_actor_index > index:
+        if self.current_actor_index >= index:
+            # When it is the current actor itself, the next one moves up into
+            # its place, and advancing after its turn must land on that one
+            # rather than skip it
             self.current_actor_index -= 1
         self.actors.pop(index)
         if self.current_actor_index >= len(self.actors):
             self.current_actor_index = 0
+        self.actor_index.remove(actor)
+        if self.turn_queue:
+            self.turn_queue.remove_actor(actor)
+        if self.navigation:
+            self.navigation.actor_removed(actor.pos)
+
+    def add_item(self, item):
+        self.items.append(item)
+        self.item_index.add(item)
+
+    def remove_item(self, item):
+        self.items.remove(item)
+        self.item_index.remove(item)
+
+    def add_corpse(self, corpse):
+        self.corpses.append(corpse)
+        self.corpse_index.add(corpse)
+
+    def close(self):
+        """Frees what the stage holds in libtcod, once it is no longer
+        played."""
+        if self.navigation:
+            self.navigation.close()
+        if self.distance_map:
+            self.distance_map.close()
 
 
 class Game:
-    def __init__(self, dungeon_level):
+    def __init__(self, dungeon_level, seed=None):
+        """Given a seed, every level of the game is generated from it, and
+        everything else left to chance (hits, monsters wandering about) is
+        drawn from a random generator of the game's own, seeded with it. So
+        the same seed and the same inputs always play out the same game.
+
+        The generator is reseeded (see reseed) at the end of every hero turn
+        and on every new level, which is what lets a saved game pick up the
+        stream where it was rather than start it over."""
         self.stage = Stage()
         self.dungeon_level = dungeon_level
+        self.seed = seed
+        self.rng = libtcod.random_new_from_seed(seed & 0xFFFFFFFF) if seed is not None else 0
+        # A LevelPregenerator for the next dungeon level, if any
+        self.next_level = None
+        # The number of turns the hero has taken
+        self.turn = 0
+        # A savegame.Journal to record every hero turn in, if any
+        self.journal = None
+        # A profiler.Profiler to time each turn with, if any
+        self.profiler = None
         self.log = Log()
         self.actions = deque()
         self.player = None
 
+    def reseed(self):
+        """Seeds the random generator from the game's seed, dungeon level and
+        turn, so that its state only depends on where the game is at."""
+        if self.seed is None:
+            return
+        if self.rng:
+            libtcod.random_delete(self.rng)
+        seed = (self.seed * 1000003 + self.dungeon_level * 65537 + self.turn) & 0xFFFFFFFF
+        self.rng = libtcod.random_new_from_seed(seed)
+
+    def close(self):
+        """Frees the game's random generator and stage, once the game is
+        over."""
+        if self.rng:
+            libtcod.random_delete(self.rng)
+            self.rng = 0
+        self.stage.close()
+
     def update(self):
         game_result = GameResult()
         while True:
             # Process any ongoing or pending actions
             while len(self.actions) > 0:
                 action = self.actions[0]
-                result = action.perform(game_result)
+                result = self._perform(action, game_result)
 
                 # Cascade through alternates until we hit bottom
                 while result.alternate:
                     self.actions.popleft()
                     action = result.alternate
                     self.actions.appendleft(action)
-                    result = action.perform(game_result)
+                    result = self._perform(action, game_result)
 
-                self.stage.map.refresh_visibility(self.player.pos)
+                if self.profiler:
+                    self.profiler.call('visibility', self.stage.map.refresh_visibility, self.player.pos)
+                else:
+                    self.stage.map.refresh_visibility(self.player.pos)
                 game_result.made_progress = True
 
                 if result.done:
                     self.actions.popleft()
-                    if result.succeeded and action.consumes_energy:
+                    # Only the hero gets to try again after a failed action;
+                    # a monster would just pick the same one again forever
+                    if action.consumes_energy and (result.succeeded or action.actor != self.player):
                         action.actor.finish_turn(action)
                         self.stage.advance_actor()
+                        if action.actor == self.player:
+                            self.turn += 1
+                            self.reseed()
+                            if self.journal:
+                                self.journal.record(self)
+                            if self.profiler:
+                                self.profiler.end_turn()
 
                     # Refresh every time the hero takes a turn
                     if action.actor == self.player:
@@ -84,6 +205,11 @@ class Game:
                     # This actor doesn't have enough energy yet, so move on to the next
                     self.stage.advance_actor()
 
+    def _perform(self, action, game_result):
+        if self.profiler:
+            return self.profiler.call('action.' + action.__class__.__name__, action.perform, game_result)
+        return action.perform(game_result)
+
 
 class GameResult:
     def __init__(self):
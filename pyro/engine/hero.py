@@ -34,7 +34,15 @@ class Hero(Actor):
     def on_death(self, attacker):
         self.game.log.message('{1} died!', self)
         self.game.stage.remove_actor(self)
-        self.game.stage.corpses.append(pyro.engine.corpse.for_hero(self))
+        self.game.stage.add_corpse(pyro.engine.corpse.for_hero(self))
+        # Death is permanent: the save goes right away, rather than when the
+        # game is left, so that a crash or closed window can't bring the hero
+        # back
+        if self.game.journal:
+            try:
+                self.game.journal.discard()
+            except OSError:
+                self.game.log.error('The saved game could not be removed.')
 
     def on_killed(self, defender):
         self.game.log.gain('{1} is dead! {2} gain %d experience points.'
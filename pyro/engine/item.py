@@ -19,6 +19,7 @@ class Item(Noun):
         self.defense_bonus = 0
         self.max_hp_bonus = 0
         self.is_equipped = False
+        self.template_id = None
 
     def noun_text(self):
         # TODO prefix
@@ -1,5 +1,7 @@
+import atexit
+import os
 import re
-from pyro.settings import MSG_HEIGHT
+from pyro.settings import MSG_HEIGHT, LOG_FILE_BATCH, LOG_FILE_MAX_BYTES, LOG_FILE_BACKUPS
 
 
 class Pronoun:
@@ -38,17 +40,46 @@ class LogType:
 
 
 class Message:
-    def __init__(self, type_, text, element=None):
-        """LogType, text, and number of times this message has been repeated."""
+    def __init__(self, type_, template, element=None, nouns=(None, None, None), text=None):
+        """LogType, format string and nouns, and number of times this message
+        has been repeated. The text is only formatted when it is first read,
+        since most messages are never displayed. Given the text (e.g. for a
+        saved message), it is used as is."""
         self.type = type_
-        self.text = text
+        self.template = template
+        self.nouns = nouns
         self.element = element
         self.count = 1
+        self._text = text
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = _format(self.template, *self.nouns)
+        return self._text
+
+    def repeats(self, template, nouns):
+        """Whether a message for the given format string and nouns would
+        read the same as this one."""
+        if self.template != template:
+            return False
+        for mine, other in zip(self.nouns, nouns):
+            if mine is not other:
+                return False
+        return True
 
 
 class Log:
     def __init__(self, messages=None):
         self.messages = messages or []
+        self._file = None
+        self._game = None
+
+    def stream_to(self, log_file, game):
+        """Also writes every message to the LogFile, along with the turn and
+        dungeon level of the game."""
+        self._file = log_file
+        self._game = game
 
     def message(self, message, noun1=None, noun2=None, noun3=None):
         self.add(LogType.MESSAGE, message, noun1, noun2, noun3)
@@ -66,21 +97,89 @@ class Log:
         self.add(LogType.ELEMENTAL, message, noun1, noun2, noun3, element)
 
     def add(self, type_, message, noun1=None, noun2=None, noun3=None, element=None):
-        message = _format(message, noun1, noun2, noun3)
+        nouns = (noun1, noun2, noun3)
 
         # See if it's a repeat of the last message
         if len(self.messages) > 0:
             last = self.messages[len(self.messages) - 1]
-            if last.text == message:
+            if last.repeats(message, nouns):
                 last.count += 1
+                if self._file:
+                    self._file.write(self._game.turn, self._game.dungeon_level, last)
                 return
 
         # It's a new message
-        self.messages.append(Message(type_, message, element))
+        self.messages.append(Message(type_, message, element, nouns))
+        if self._file:
+            self._file.write(self._game.turn, self._game.dungeon_level, self.messages[-1])
         if len(self.messages) == MSG_HEIGHT+1:
             del self.messages[0]
 
 
+class LogFile:
+    """Appends messages to a file, one line each:
+
+        turn <tab> dungeon level <tab> type <tab> element <tab> text
+
+    Messages are held until a whole batch can be written at once, and
+    whatever is left is written when the file is closed, which happens at
+    exit at the latest. When the file grows past max_bytes it is renamed to
+    path.1 (shifting older ones up to path.<backups>) and a new one is
+    started."""
+    def __init__(self, path, batch=LOG_FILE_BATCH, max_bytes=LOG_FILE_MAX_BYTES,
+                 backups=LOG_FILE_BACKUPS):
+        self.path = path
+        self._batch = batch
+        self._max_bytes = max_bytes
+        self._backups = backups
+        self._pending = []
+        self._file = open(path, 'a')
+        self._size = self._file.tell()
+        atexit.register(self.close)
+
+    def write(self, turn, dungeon_level, message):
+        # Only the references are kept; the text is formatted with the batch
+        self._pending.append((turn, dungeon_level, message))
+        if len(self._pending) >= self._batch:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        lines = []
+        for turn, dungeon_level, message in self._pending:
+            element = message.element.name if message.element else '-'
+            lines.append('%d\t%d\t%s\t%s\t%s\n' % (turn, dungeon_level, message.type,
+                                                   element, message.text))
+        del self._pending[:]
+
+        data = ''.join(lines)
+        self._file.write(data)
+        self._file.flush()
+        self._size += len(data)
+        if self._size >= self._max_bytes:
+            self._rotate()
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.flush()
+        self._file.close()
+
+    def _rotate(self):
+        self._file.close()
+        for i in range(self._backups - 1, 0, -1):
+            older = '%s.%d' % (self.path, i)
+            if os.path.exists(older):
+                os.rename(older, '%s.%d' % (self.path, i + 1))
+        if self._backups > 0:
+            os.rename(self.path, self.path + '.1')
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, 'a')
+        self._size = 0
+
+
 def _format(text, noun1=None, noun2=None, noun3=None):
     """
     The same message can apply to a variety of subjects and objects, and it
@@ -142,31 +241,94 @@ def _format(text, noun1=None, noun2=None, noun3=None):
     
     Finally, the first letter in the result will be capitalized to properly
     sentence case it.
-    """
-    result = text
-
-    nouns = [noun1, noun2, noun3]
-    for i in range(1, 4):
-        noun = nouns[i - 1]
-        if noun:
-            result = result.replace('{%d}' % i, noun.noun_text())
 
-            # Handle pronouns
-            result = result.replace('{%d he}' % i, noun.pronoun().subjective)
-            result = result.replace('{%d him}' % i, noun.pronoun().objective)
-            result = result.replace('{%d his}' % i, noun.pronoun().possessive)
+    Slots for missing nouns are left as they are, and so are the verbs if
+    there is no first noun.
+    """
+    nouns = (noun1, noun2, noun3)
 
     # Make the verb match the subject (which is assumed to be the first noun)
+    first = False
     if noun1:
-        result = _conjugate(result, noun1.pronoun())
+        pronoun = noun1.pronoun()
+        first = pronoun == Pronoun.YOU or pronoun == Pronoun.THEY
+
+    parts = []
+    for kind, value, other, source in _compile(text):
+        if kind == _LITERAL:
+            parts.append(value)
+        elif kind == _NOUN:
+            noun = nouns[value]
+            if not noun:
+                parts.append(source)
+            elif other is None:
+                parts.append(noun.noun_text())
+            else:
+                parts.append(getattr(noun.pronoun(), other))
+        elif noun1:
+            parts.append(value if first else other)
+        else:
+            parts.append(source)
 
     # Sentence case it by capitalizing the first letter
-    return result.capitalize()
+    return ''.join(parts).capitalize()
 
 
-def _conjugate(text, pronoun):
-    first = pronoun == Pronoun.YOU or pronoun == Pronoun.THEY
-    return _categorize(text, first)
+# Kinds of template segments
+_LITERAL = 0
+_NOUN = 1
+_VERB = 2
+
+_RE_SLOT = re.compile(r"\{([123])(?: (he|him|his))?\}|\[(\w+?)\]|\[([^|\]]+)\|([^\]]+)\]")
+
+_PRONOUN_FORMS = {'he': 'subjective', 'him': 'objective', 'his': 'possessive'}
+
+# Compiled templates by format string. Most messages come from a small set
+# of literals, but some are formatted before being logged, so the cache is
+# emptied whenever it grows past its limit.
+_TEMPLATES = {}
+_MAX_TEMPLATES = 512
+
+
+def _compile(text):
+    """
+    Parses a format string for _format() into a list of segments, each a
+    tuple of (kind, value, other, source):
+
+        * A literal: (_LITERAL, text, None, text)
+        * A noun or pronoun: (_NOUN, noun index, None or pronoun form, source)
+        * A verb: (_VERB, first category, second category, source)
+
+    The source text of a slot is used as is when its noun is missing.
+    Templates are cached, so each format string is only parsed once.
+    """
+    template = _TEMPLATES.get(text)
+    if template is not None:
+        return template
+
+    template = []
+    position = 0
+    for match in _RE_SLOT.finditer(text):
+        if match.start() > position:
+            literal = text[position:match.start()]
+            template.append((_LITERAL, literal, None, literal))
+        number, pronoun, suffix, first, second = match.groups()
+        if number:
+            form = _PRONOUN_FORMS[pronoun] if pronoun else None
+            template.append((_NOUN, int(number) - 1, form, match.group(0)))
+        elif suffix:
+            template.append((_VERB, '', suffix, match.group(0)))
+        else:
+            template.append((_VERB, first, second, match.group(0)))
+        position = match.end()
+    if position < len(text):
+        literal = text[position:]
+        template.append((_LITERAL, literal, None, literal))
+
+    if len(_TEMPLATES) >= _MAX_TEMPLATES:
+        _TEMPLATES.clear()
+    _TEMPLATES[text] = template
+    return template
 
 
 _RE_OPTIONAL_SUFFIX = re.compile(r"\[(\w+?)\]")
@@ -8,6 +8,7 @@ class Monster(Actor):
     def __init__(self, game):
         Actor.__init__(self, game)
         self.ai = None
+        self.template_id = None
 
     def noun_text(self):
         # TODO defer to breed
@@ -30,7 +31,7 @@ class Monster(Actor):
     def on_death(self, attacker):
         # Transform it into a nasty corpse!
         self.game.stage.remove_actor(self)
-        self.game.stage.corpses.append(pyro.engine.corpse.for_monster(self))
+        self.game.stage.add_corpse(pyro.engine.corpse.for_monster(self))
 
     def on_killed(self, defender):
         self.game.log.message('{1} kills {2}!', self, defender)
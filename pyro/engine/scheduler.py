@@ -0,0 +1,70 @@
+import heapq
+from pyro.energy import ACTION_COST, ENERGY_GAINS
+
+
+class EnergyQueue:
+    """Orders actors by the tick at which they will next have enough energy
+    to take a turn.
+
+    The round-robin loop visits every actor once per tick, giving each one
+    energy until one of them can act. This computes that tick up front from
+    each actor's energy and speed instead, and keeps actors in a heap, so the
+    game loop jumps straight to the next actor that can act. Ties are broken
+    by the order actors were added in, which gives the same turn order as the
+    round-robin loop."""
+    def __init__(self, actors):
+        self._queue = []
+        self._next_order = 0
+        # The entry of the actor whose turn it is, and whether it was removed
+        # before its turn was over
+        self._current = None
+        self._current_removed = False
+        for actor in actors:
+            self.add(actor)
+
+    def add(self, actor):
+        self._schedule(actor, 0, self._next_order)
+        self._next_order += 1
+
+    def _schedule(self, actor, first_tick, order):
+        gains = _gains_needed(actor)
+        ready_tick = first_tick + max(gains, 1) - 1
+        heapq.heappush(self._queue, [ready_tick, order, actor, gains])
+
+    def current_actor(self):
+        entry = self._queue[0]
+        self._current = entry
+        actor = entry[2]
+        # Catch up on the energy the actor gained while it was waiting
+        for _ in range(entry[3]):
+            actor.energy.gain(actor.speed())
+        entry[3] = 0
+        return actor
+
+    def advance_actor(self):
+        """Reschedules the current actor after it has had its turn."""
+        self._current = None
+        if self._current_removed:
+            # It is gone already, and the next actor, now first, keeps both
+            # its turn and the energy it has yet to catch up on
+            self._current_removed = False
+            return
+        tick, order, actor, _ = heapq.heappop(self._queue)
+        self._schedule(actor, tick + 1, order)
+
+    def remove_actor(self, actor):
+        if self._current is not None and self._current[2] is actor:
+            self._current_removed = True
+        self._queue = [entry for entry in self._queue if entry[2] is not actor]
+        heapq.heapify(self._queue)
+
+    def __len__(self):
+        return len(self._queue)
+
+
+def _gains_needed(actor):
+    missing = ACTION_COST - actor.energy.energy
+    if missing <= 0:
+        return 0
+    gain = ENERGY_GAINS[actor.speed()]
+    return (missing + gain - 1) // gain
@@ -0,0 +1,304 @@
+"""Runs the game engine without a display.
+
+The hero is driven by a controller instead of the keyboard and the game is
+advanced as fast as possible with no rendering at all, which is what balance
+sweeps, soak tests and benchmarks need. Nothing here touches the root
+console, so it runs on servers with no display:
+
+    python -m pyro.headless --turns 10000 --games 5
+
+With --replay, a recorded game is played back instead, which gives both a
+way to reproduce what happened in it and a realistic load for profiling.
+With --profile, where the time went is written to a file (see
+pyro.profiler).
+
+Like the game itself, this must be run from the repository root so that the
+resources can be found.
+"""
+import argparse
+import json
+import time
+import libtcodpy as libtcod
+import pyro.direction
+from pyro import objects
+from pyro.engine.actions import UseAction, WalkAction
+from pyro.engine.game import Game
+from pyro.engine.log import LogFile
+from pyro.map import make_map, descend
+from pyro.navigation import DistanceMap
+from pyro.position import Position
+from pyro.profiler import Profiler
+from pyro.recording import read_recording, decode_result
+from pyro.settings import LEVEL_UP_STAT_HP, LEVEL_UP_STAT_POWER, LEVEL_UP_STAT_DEFENSE, TORCH_RADIUS
+from pyro.spell import Spell
+from pyro.target import Target
+from pyro.utilities import closest_monster
+
+
+# Returned by a controller to take the stairs down
+DESCEND = 'descend'
+
+
+class HeroController:
+    """Decides what the hero does, in place of the player."""
+    def next_action(self, game):
+        """Returns an Action for the hero, or DESCEND."""
+        raise Exception('implement in subclass')
+
+    def choose_stat(self, game):
+        """Returns the stat to raise on level up: 0 for HP, 1 for power and
+        2 for defense, like the level up menu."""
+        return 0
+
+
+class ScriptedController(HeroController):
+    """Plays back a fixed sequence of actions, then rests."""
+    def __init__(self, actions):
+        self._actions = iter(actions)
+
+    def next_action(self, game):
+        return next(self._actions, None) or WalkAction(pyro.direction.Direction.NONE)
+
+
+class AutoController(HeroController):
+    """A simple-minded hero: drinks a potion when badly hurt, fights whatever
+    monster it can see, and otherwise heads for the stairs."""
+    def __init__(self):
+        self._stage = None
+        self._stairs = None
+        self._stairs_distances = None
+        self._walkability = None
+
+    def next_action(self, game):
+        hero = game.player
+
+        if hero.hp < hero.max_hp / 3:
+            for item in hero.inventory:
+                if item.can_use() and Spell.TYPE_HEAL == item.on_use.type:
+                    return UseAction(item, Target(hero))
+
+        monster = closest_monster(game, TORCH_RADIUS)
+        if monster:
+            next_step = game.stage.navigation.next_step(hero.pos, monster.pos, TORCH_RADIUS * 2)
+            if next_step:
+                next_x, next_y = next_step
+                return WalkAction(pyro.direction.from_vector(next_x - hero.pos.x, next_y - hero.pos.y))
+
+        if game.stage.map.tile_type(hero.pos).is_exit:
+            return DESCEND
+
+        self._find_stairs(game)
+        direction = None
+        if self._stairs:
+            direction = self._stairs_distances.step_towards(
+                self._stairs, hero.pos, game.stage.navigation.is_walkable, float('inf'))
+        return WalkAction(direction or pyro.direction.random(game.rng))
+
+    def _find_stairs(self, game):
+        if self._stage is game.stage:
+            return
+        self._stage = game.stage
+        self._stairs = None
+        if self._stairs_distances:
+            # The old stage's are of no more use
+            self._stairs_distances.close()
+            libtcod.map_delete(self._walkability)
+        game_map = game.stage.map
+
+        # Closed doors are in the way of monsters, but the hero just walks
+        # through them, so they count as open here
+        walkability = libtcod.map_new(game_map.width, game_map.height)
+        for y in range(game_map.height):
+            for x in range(game_map.width):
+                tile_type = game_map.tile_type_at(x, y)
+                if tile_type.is_exit:
+                    self._stairs = Position(x, y)
+                walkable = tile_type.passable or tile_type.opens_to is not None
+                libtcod.map_set_properties(walkability, x, y, tile_type.transparent, walkable)
+        self._walkability = walkability
+        self._stairs_distances = DistanceMap(game_map, walkability)
+
+
+class Simulation:
+    """A game in progress, without a user interface."""
+    def __init__(self, controller=None, dungeon_level=1, log_file=None, seed=None):
+        self.controller = controller or AutoController()
+        self.game = Game(dungeon_level=dungeon_level, seed=seed)
+        if log_file:
+            self.game.log.stream_to(log_file, self.game)
+        objects.new_player(self.game)
+        make_map(self.game)
+        self.turns = 0
+        self.updates = 0
+        self.elapsed = 0.0
+
+    def run(self, max_turns):
+        """Plays until the hero has been given max_turns actions or dies."""
+        game = self.game
+        start = time.time()
+        end_turn = self.turns + max_turns
+        while self.turns < end_turn and game.player.is_alive():
+            if game.player.can_level_up():
+                self._level_up()
+
+            if game.player.needs_input():
+                action = self.controller.next_action(game)
+                self.turns += 1
+                if DESCEND == action:
+                    descend(game)
+                    continue
+                game.player.next_action = action
+
+            game.update()
+            self.updates += 1
+        self.elapsed += time.time() - start
+        return self
+
+    def _level_up(self):
+        # Mirrors the level up menu in GameScreen
+        hero = self.game.player
+        hero.level_up()
+        stat = self.controller.choose_stat(self.game)
+        if stat == 0:
+            hero.base_max_hp += LEVEL_UP_STAT_HP
+            hero.hp += LEVEL_UP_STAT_HP
+        elif stat == 1:
+            hero.base_power += LEVEL_UP_STAT_POWER
+        elif stat == 2:
+            hero.base_defense += LEVEL_UP_STAT_DEFENSE
+
+    def stats(self):
+        hero = self.game.player
+        return dict(
+            turns=self.turns,
+            updates=self.updates,
+            elapsed=self.elapsed,
+            turns_per_second=self.turns / self.elapsed if self.elapsed else None,
+            alive=hero.is_alive(),
+            hero_level=hero.level,
+            dungeon_level=self.game.dungeon_level,
+        )
+
+
+class HeadlessUI:
+    """Just enough of a UserInterface to run screens without a display: they
+    are stacked as usual but never drawn."""
+    def __init__(self):
+        self.screens = []
+
+    def dirty(self, reason=None):
+        pass
+
+    def push(self, screen, tag=None, data=None):
+        screen.tag = tag
+        screen.data = data
+        screen.bind(self)
+        self.screens.append(screen)
+
+    def pop(self, result=None):
+        screen = self.screens.pop()
+        screen.unbind()
+        if len(self.screens) > 0:
+            self.top_screen().activate(result, screen.tag, screen.data)
+
+    def top_screen(self):
+        return self.screens[len(self.screens) - 1]
+
+
+class Replay:
+    """Plays back a recording (see pyro.recording) as fast as possible, into
+    a GameScreen with no display, so the game goes through the very same
+    code as when it was played. The next level is only generated in the
+    background, like the game does, when asked to, since the thread would
+    otherwise compete with the replay itself for time."""
+    def __init__(self, path, log_file=None, pregenerate=False):
+        from pyro.ui.game_screen import GameScreen
+        from pyro.ui.main_menu_screen import new_game
+        header, self.events = read_recording(path)
+        self.game = new_game(header['seed'], log_file)
+        self.ui = HeadlessUI()
+        self.screen = GameScreen(self.game, pregenerate=pregenerate)
+        self.ui.push(self.screen)
+        self.played = 0
+        self.elapsed = 0.0
+
+    def run(self):
+        """Plays until the end of the recording, the hero dies or the game is
+        left through the pause menu."""
+        start = time.time()
+        screen = self.screen
+        for event in self.events:
+            while screen.updates < event['update'] and self.game.player.is_alive():
+                screen.update()
+            if not self.game.player.is_alive():
+                break
+            self.played += 1
+            if 'input' in event:
+                screen.handle_input(event['input'])
+                continue
+            if event['tag'] == 'game.pause' and event['result'] is not None:
+                # New Game or Quit
+                break
+            top = self.ui.top_screen()
+            if top is screen:
+                raise ValueError('Recording has a {0} selection with no screen for it'.format(event['tag']))
+            self.ui.pop(decode_result(event['result'], top, self.game))
+        self.elapsed += time.time() - start
+        return self
+
+    def stats(self):
+        hero = self.game.player
+        return dict(
+            events=len(self.events),
+            played=self.played,
+            updates=self.screen.updates,
+            turns=self.game.turn,
+            elapsed=self.elapsed,
+            updates_per_second=self.screen.updates / self.elapsed if self.elapsed else None,
+            alive=hero.is_alive(),
+            hero_level=hero.level,
+            dungeon_level=self.game.dungeon_level,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Play games without a display.')
+    parser.add_argument('--turns', type=int, default=1000,
+                        help='maximum hero turns per game')
+    parser.add_argument('--games', type=int, default=1,
+                        help='number of games to play')
+    parser.add_argument('--log-file', help='file to append every game message to')
+    parser.add_argument('--seed', type=int,
+                        help='seed of the first game\'s levels; each next game adds one')
+    parser.add_argument('--replay', help='play back a recorded game instead')
+    parser.add_argument('--pregenerate', action='store_true',
+                        help='generate the next level in the background while replaying, like the game')
+    parser.add_argument('--profile',
+                        help='file to write where the time of every turn went to, as JSON')
+    args = parser.parse_args()
+
+    log_file = LogFile(args.log_file) if args.log_file else None
+    # One profiler adds up every game
+    profiler = Profiler() if args.profile else None
+    try:
+        if args.replay:
+            replay = Replay(args.replay, log_file, args.pregenerate)
+            replay.game.profiler = profiler
+            print(json.dumps(replay.run().stats(), sort_keys=True))
+            replay.game.close()
+        else:
+            for i in range(args.games):
+                seed = None if args.seed is None else args.seed + i
+                simulation = Simulation(log_file=log_file, seed=seed)
+                simulation.game.profiler = profiler
+                print(json.dumps(simulation.run(args.turns).stats(), sort_keys=True))
+                simulation.game.close()
+    finally:
+        if log_file:
+            log_file.close()
+    if profiler:
+        profiler.dump(args.profile)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,34 +1,60 @@
+import os
 import libtcodpy as libtcod
-from pyro.settings import SCREEN_HEIGHT, SCREEN_WIDTH, LIMIT_FPS
+from pyro.engine.log import LogFile
+from pyro.settings import SCREEN_HEIGHT, SCREEN_WIDTH, LIMIT_FPS, LOG_FILE_VARIABLE, RECORDING_VARIABLE
+from pyro.settings import FRAME_METRICS_VARIABLE, FRAME_OVERLAY_VARIABLE
 from pyro.ui.main_menu_screen import MainMenuScreen
+from pyro.ui.metrics import FrameMetrics
 from pyro.ui.userinterface import UserInterface
 from pyro.ui.keys import Key
 import pyro.ui.inputs as inputs
 
-libtcod.console_set_custom_font('resources/terminal8x12_gs_tc.png',
-                                libtcod.FONT_TYPE_GREYSCALE |
-                                libtcod.FONT_LAYOUT_TCOD)
-libtcod.console_init_root(SCREEN_WIDTH, SCREEN_HEIGHT,
-                          'Tombs Of The Ancient Kings', False)
-libtcod.sys_set_fps(LIMIT_FPS)
-
-ui = UserInterface()
-
-ui.bind_key(Key.ESCAPE, inputs.EXIT)
-ui.bind_key(Key.ENTER, inputs.ENTER)
-ui.bind_key(Key.UP, inputs.NORTH)
-ui.bind_key(Key.DOWN, inputs.SOUTH)
-ui.bind_key(Key.LEFT, inputs.WEST)
-ui.bind_key(Key.RIGHT, inputs.EAST)
-ui.bind_key(Key.C, inputs.HERO_INFO)
-ui.bind_key(Key.G, inputs.PICKUP)
-ui.bind_key(Key.D, inputs.DROP)
-ui.bind_key(Key.I, inputs.INVENTORY)
-ui.bind_key(Key.F, inputs.REST)
-ui.bind_key(Key.R, inputs.CLOSE_DOOR)
-
-ui.push(MainMenuScreen())
-
-while ui.is_running():
-    ui.refresh()
-    ui.handle_input()
+
+def main():
+    libtcod.console_set_custom_font('resources/terminal8x12_gs_tc.png',
+                                    libtcod.FONT_TYPE_GREYSCALE |
+                                    libtcod.FONT_LAYOUT_TCOD)
+    libtcod.console_init_root(SCREEN_WIDTH, SCREEN_HEIGHT,
+                              'Tombs Of The Ancient Kings', False)
+    libtcod.sys_set_fps(LIMIT_FPS)
+
+    metrics = None
+    if os.environ.get(FRAME_METRICS_VARIABLE) or os.environ.get(FRAME_OVERLAY_VARIABLE):
+        metrics = FrameMetrics(os.environ.get(FRAME_METRICS_VARIABLE),
+                               bool(os.environ.get(FRAME_OVERLAY_VARIABLE)))
+
+    ui = UserInterface(metrics)
+
+    ui.bind_key(Key.ESCAPE, inputs.EXIT)
+    ui.bind_key(Key.ENTER, inputs.ENTER)
+    ui.bind_key(Key.UP, inputs.NORTH)
+    ui.bind_key(Key.DOWN, inputs.SOUTH)
+    ui.bind_key(Key.LEFT, inputs.WEST)
+    ui.bind_key(Key.RIGHT, inputs.EAST)
+    ui.bind_key(Key.C, inputs.HERO_INFO)
+    ui.bind_key(Key.G, inputs.PICKUP)
+    ui.bind_key(Key.D, inputs.DROP)
+    ui.bind_key(Key.I, inputs.INVENTORY)
+    ui.bind_key(Key.F, inputs.REST)
+    ui.bind_key(Key.R, inputs.CLOSE_DOOR)
+
+    log_file = None
+    if os.environ.get(LOG_FILE_VARIABLE):
+        log_file = LogFile(os.environ[LOG_FILE_VARIABLE])
+
+    ui.push(MainMenuScreen(log_file, os.environ.get(RECORDING_VARIABLE)))
+
+    try:
+        while ui.is_running():
+            ui.refresh()
+            ui.handle_input()
+    finally:
+        # Whatever the game logged before a crash is what explains it
+        if log_file:
+            log_file.close()
+        if metrics:
+            metrics.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,6 @@
+import logging
+import threading
+from array import array
 import libtcodpy as libtcod
 import pyro.objects as objects
 from pyro.engine.game import Stage
@@ -5,9 +8,13 @@ from pyro.utilities import is_blocked
 from pyro.settings import ROOM_MIN_SIZE, ROOM_MAX_SIZE, MAP_HEIGHT, MAP_WIDTH, MAX_ROOMS
 from pyro.settings import TORCH_RADIUS, FOV_LIGHT_WALLS, FOV_ALGORITHM
 from pyro.position import Position
+from pyro.templates import from_dungeon_level
 from pyro.tile import Tile
 
 
+_log = logging.getLogger(__name__)
+
+
 class Rect:
     def __init__(self, x, y, w, h):
         self.x1 = x
@@ -24,39 +31,85 @@ class Rect:
         return (self.x1 <= other.x2 and self.x2 >= other.x1 and
                 self.y1 <= other.y2 and self.y2 >= other.y1)
 
-    def random_point_inside(self):
-        return Position(libtcod.random_get_int(0, self.x1+1, self.x2-1),
-                        libtcod.random_get_int(0, self.y1+1, self.y2-1))
-
-
-class TileMeta:
-    def __init__(self):
-        self.room_wall = False
-        self.tunnelled = False
+    def random_point_inside(self, rng=0):
+        return Position(libtcod.random_get_int(rng, self.x1+1, self.x2-1),
+                        libtcod.random_get_int(rng, self.y1+1, self.y2-1))
 
 
 class Map:
+    """The tiles of a level.
+
+    Tile types are stored by id in a compact byte array, one cell per byte,
+    in row-major order. The passable, transparent, explored and visible flags
+    of each cell live in parallel planes of the same layout so that the hot
+    paths (movement, FOV, rendering) read contiguous memory without ever
+    touching the tile type itself."""
     def __init__(self, height, width):
         self.height = height
         self.width = width
-        self.tiles = [[Tile()
-                       for _ in range(height)]
-                      for _ in range(width)]
+        size = width * height
+        self.types = array('B', [Tile.TYPE_WALL.id]) * size
+        self.passable = bytearray([Tile.TYPE_WALL.passable]) * size
+        self.transparent = bytearray([Tile.TYPE_WALL.transparent]) * size
+        self.explored = bytearray(size)
+        self.visible = bytearray(size)
         self.fov_map = None
         self.visibility_dirty = True
+        self._fov_origin = None
+        # Bounds of the area lit by the last FOV computation
+        self._fov_bounds = None
+        # Cells whose passable/transparent flags changed since they were
+        # last pushed into the FOV map
+        self._changed_cells = set()
+        self._listeners = []
+        self._visibility_listeners = []
 
     def __refresh_fov(self, fov_map):
+        width = self.width
+        passable = self.passable
+        transparent = self.transparent
         for y in range(self.height):
-            for x in range(self.width):
+            row = y * width
+            for x in range(width):
                 libtcod.map_set_properties(fov_map, x, y,
-                                           self.tiles[x][y].transparent,
-                                           self.tiles[x][y].passable)
+                                           transparent[row + x],
+                                           passable[row + x])
+
+    def index(self, x, y):
+        return y * self.width + x
+
+    def tile_type(self, position):
+        return Tile.TYPES[self.types[position.y * self.width + position.x]]
 
-    def tile(self, position):
-        return self.tiles[position.x][position.y]
+    def tile_type_at(self, x, y):
+        return Tile.TYPES[self.types[y * self.width + x]]
 
-    def tile_at(self, x, y):
-        return self.tiles[x][y]
+    def set_tile_type(self, position, tile_type):
+        self.set_tile_type_at(position.x, position.y, tile_type)
+
+    def set_tile_type_at(self, x, y, tile_type):
+        i = y * self.width + x
+        if self.types[i] == tile_type.id:
+            return
+        changed = (self.passable[i] != tile_type.passable or
+                   self.transparent[i] != tile_type.transparent)
+        self.types[i] = tile_type.id
+        self.passable[i] = tile_type.passable
+        self.transparent[i] = tile_type.transparent
+        if changed and self.fov_map is not None:
+            self._changed_cells.add(i)
+        for listener in self._listeners:
+            listener(x, y)
+
+    def add_listener(self, listener):
+        """Registers a function called with (x, y) whenever a cell's tile
+        type changes."""
+        self._listeners.append(listener)
+
+    def add_visibility_listener(self, listener):
+        """Registers a function called with (x, y) whenever a cell comes
+        into or goes out of view."""
+        self._visibility_listeners.append(listener)
 
     def make_fov_map(self):
         # Create the FOV map according to the generated map
@@ -64,76 +117,141 @@ class Map:
         self.__refresh_fov(fov_map)
         return fov_map
 
+    def reset_fov(self):
+        """Rebuilds the FOV map from scratch, e.g. for a new level."""
+        self.fov_map = self.make_fov_map()
+        self._changed_cells.clear()
+        self.visibility_dirty = True
+
+    def flush_properties(self):
+        """Pushes the cells changed since the last flush into the FOV map,
+        which also serves as the tile-only walkability map for distance
+        maps. Returns whether there were any."""
+        if not self._changed_cells:
+            return False
+        width = self.width
+        for i in self._changed_cells:
+            libtcod.map_set_properties(self.fov_map, i % width, i // width,
+                                       self.transparent[i], self.passable[i])
+        self._changed_cells.clear()
+        self.visibility_dirty = True
+        return True
+
     def is_xy_in_fov(self, x, y):
-        return libtcod.map_is_in_fov(self.fov_map, x, y)
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return self.visible[y * self.width + x]
+        return False
 
     def is_in_fov(self, pos):
-        return libtcod.map_is_in_fov(self.fov_map, pos.x, pos.y)
+        return self.is_xy_in_fov(pos.x, pos.y)
 
     def dirty_visibility(self):
+        """Forces the FOV to be recomputed on the next refresh."""
         self.visibility_dirty = True
 
     def refresh_visibility(self, pos):
-        if self.visibility_dirty:
-            self.__refresh_fov(self.fov_map)
+        # Only recompute when the cell properties changed or the viewer moved
+        self.flush_properties()
+        viewer_moved = self._fov_origin != (pos.x, pos.y)
+        if viewer_moved or self.visibility_dirty:
             libtcod.map_compute_fov(self.fov_map, pos.x, pos.y,
                                     TORCH_RADIUS, FOV_LIGHT_WALLS, FOV_ALGORITHM)
+            self._fov_origin = (pos.x, pos.y)
             self.visibility_dirty = False
 
+            # Nothing outside the torch radius can have changed, so only the
+            # area lit before and the area lit now need to be compared
+            radius = TORCH_RADIUS or max(self.width, self.height)
+            bounds = (max(pos.x - radius, 0), max(pos.y - radius, 0),
+                      min(pos.x + radius + 1, self.width), min(pos.y + radius + 1, self.height))
+            if self._fov_bounds and self._fov_bounds != bounds:
+                self.__update_visible(*self._fov_bounds)
+            self.__update_visible(*bounds)
+            self._fov_bounds = bounds
+
+    def __update_visible(self, x1, y1, x2, y2):
+        width = self.width
+        fov_map = self.fov_map
+        visible = self.visible
+        explored = self.explored
+        listeners = self._visibility_listeners
+        for y in range(y1, y2):
+            row = y * width
+            for x in range(x1, x2):
+                lit = libtcod.map_is_in_fov(fov_map, x, y)
+                if lit != visible[row + x]:
+                    visible[row + x] = lit
+                    if lit:
+                        explored[row + x] = True
+                    for listener in listeners:
+                        listener(x, y)
+
     def is_on_map(self, position):
         x_in_bounds = 0 <= position.x < self.width
         y_in_bounds = 0 <= position.y < self.height
         return x_in_bounds and y_in_bounds
 
     def movement_blocked(self, x, y):
-        return not self.tiles[x][y].passable
+        return not self.passable[y * self.width + x]
 
     def vision_blocked(self, x, y):
-        return not self.tiles[x][y].transparent
+        return not self.transparent[y * self.width + x]
 
     def is_explored(self, x, y):
-        return self.tiles[x][y].explored
+        return self.explored[y * self.width + x]
 
     def mark_explored(self, x, y):
-        self.tiles[x][y].explored = True
+        self.explored[y * self.width + x] = True
 
 
 class LevelBuilder:
-    def __init__(self, game, game_map, game_actors, game_items):
+    def __init__(self, game, dungeon_level, game_map, game_actors, game_items, rng=0):
+        """Builds the given dungeon level of the game, without touching the
+        game itself, so it can be done in the background. Everything random
+        about the level is drawn from the libtcod random generator rng (by
+        default, the global one)."""
         self._game = game
+        self.dungeon_level = dungeon_level
+        self._rng = rng
+        # Where the hero will start; nothing else is placed there
+        self.start = None
         self.map = game_map
-        self.meta_map = [[TileMeta()
-                          for _ in range(game_map.height)]
-                         for _ in range(game_map.width)]
+        # Generation-only flags, in the same layout as the map's planes
+        self.room_walls = bytearray(game_map.width * game_map.height)
+        self.tunnelled = bytearray(game_map.width * game_map.height)
         self.game_actors = game_actors
         self.game_items = game_items
 
     def finalize(self):
-        self.map.fov_map = self.map.make_fov_map()
-        self.map.refresh_visibility(self._game.player.pos)
-        self._game.stage = Stage(self.map, self.game_actors, self.game_items)
+        """Returns the Stage for the level, without the hero."""
+        self.map.reset_fov()
+        self.map.refresh_visibility(self.start)
+        return Stage(self.map, self.game_actors, self.game_items)
+
+    def is_blocked(self, position):
+        return position == self.start or is_blocked(self.map, self.game_actors, position)
 
     def mark_tunnelled(self, x, y):
-        self.meta_map[x][y].tunnelled = True
+        self.tunnelled[self.map.index(x, y)] = True
 
     def create_room(self, room):
         # Go through the tiles in the rectangle and make them passable
         for x in range(room.x1 + 1, room.x2):
             for y in range(room.y1 + 1, room.y2):
-                self.map.tiles[x][y].type = Tile.TYPE_FLOOR
+                self.map.set_tile_type_at(x, y, Tile.TYPE_FLOOR)
 
         # Mark the exterior tiles as walls
         for x in range(room.x1, room.x2+1):
-            self.meta_map[x][room.y1].room_wall = True
-            self.meta_map[x][room.y2].room_wall = True
+            self.room_walls[self.map.index(x, room.y1)] = True
+            self.room_walls[self.map.index(x, room.y2)] = True
         for y in range(room.y1, room.y2+1):
-            self.meta_map[room.x1][y].room_wall = True
-            self.meta_map[room.x2][y].room_wall = True
+            self.room_walls[self.map.index(room.x1, y)] = True
+            self.room_walls[self.map.index(room.x2, y)] = True
 
     def create_tunnel_to(self, previous_room, current_room):
         previous = previous_room.center()
         current = current_room.center()
-        if libtcod.random_get_int(0, 0, 1) == 1:
+        if libtcod.random_get_int(self._rng, 0, 1) == 1:
             # First move horizontally, then vertically
             self._create_h_tunnel(previous.x, current.x, previous.y)
             self._create_v_tunnel(previous.y, current.y, current.x)
@@ -144,38 +262,38 @@ class LevelBuilder:
 
     def _create_h_tunnel(self, x1, x2, y):
         for x in range(min(x1, x2), max(x1, x2) + 1):
-            self.map.tiles[x][y].type = Tile.TYPE_FLOOR
-            if self.meta_map[x][y].room_wall:
+            self.map.set_tile_type_at(x, y, Tile.TYPE_FLOOR)
+            if self.room_walls[self.map.index(x, y)]:
                 self.mark_tunnelled(x, y)
 
     def _create_v_tunnel(self, y1, y2, x):
         for y in range(min(y1, y2), max(y1, y2) + 1):
-            self.map.tiles[x][y].type = Tile.TYPE_FLOOR
-            if self.meta_map[x][y].room_wall:
+            self.map.set_tile_type_at(x, y, Tile.TYPE_FLOOR)
+            if self.room_walls[self.map.index(x, y)]:
                 self.mark_tunnelled(x, y)
 
     def place_stairs(self, room):
         position = room.center()
-        self.map.tiles[position.x][position.y].type = Tile.TYPE_STAIRS
+        self.map.set_tile_type(position, Tile.TYPE_STAIRS)
 
     def _place_grass_tile(self, position):
-        self.map.tiles[position.x][position.y].type = Tile.TYPE_TALL_GRASS
+        self.map.set_tile_type(position, Tile.TYPE_TALL_GRASS)
 
     def place_grass(self, room):
-        if libtcod.random_get_int(0, 1, 2) == 1:
-            point = room.random_point_inside()
-            while is_blocked(self.map, self.game_actors, point):
-                point = room.random_point_inside()
+        if libtcod.random_get_int(self._rng, 1, 2) == 1:
+            point = room.random_point_inside(self._rng)
+            while self.is_blocked(point):
+                point = room.random_point_inside(self._rng)
 
             self._place_grass_tile(point)
 
-            num_grass = libtcod.random_get_int(0, 4, 8)
+            num_grass = libtcod.random_get_int(self._rng, 4, 8)
             for i in range(num_grass):
-                point = random_point_surrounding(point)
+                point = random_point_surrounding(point, self._rng)
                 while not self.map.is_on_map(point):
-                    point = random_point_surrounding(point)
+                    point = random_point_surrounding(point, self._rng)
 
-                if not is_blocked(self.map, self.game_actors, point):
+                if not self.is_blocked(point):
                     self._place_grass_tile(point)
 
     CREATURE_CHANCES = dict(
@@ -184,79 +302,72 @@ class LevelBuilder:
     )
 
     def place_creatures(self, creature_type, room):
-        creatures = filter(lambda m: m['type'] == creature_type, objects.MONSTER_TEMPLATES)
-        if len(creatures) == 0:
+        if len(objects.MONSTERS.of_type(creature_type)) == 0:
             return
 
         # Random number of creatures
-        max_creatures = from_dungeon_level(self.CREATURE_CHANCES[creature_type], self._game.dungeon_level)
-        num_creatures = libtcod.random_get_int(0, 0, max_creatures)
-        creature_chances = get_spawn_chances(creatures, self._game.dungeon_level)
+        max_creatures = from_dungeon_level(self.CREATURE_CHANCES[creature_type], self.dungeon_level)
+        num_creatures = libtcod.random_get_int(self._rng, 0, max_creatures)
+        creature_chances = objects.MONSTERS.spawn_chances(self.dungeon_level, creature_type)
 
-        chance = libtcod.random_get_int(0, 1, 100)
+        chance = libtcod.random_get_int(self._rng, 1, 100)
         if chance <= 5:
             num_creatures = max_creatures * 3
 
         for i in range(num_creatures):
             # Random position for creature
-            point = room.random_point_inside()
+            point = room.random_point_inside(self._rng)
 
-            if not is_blocked(self.map, self.game_actors, point):
-                choice = random_choice(creature_chances)
+            if not self.is_blocked(point):
+                choice = random_choice(creature_chances, self._rng)
                 creature = objects.new_monster(self._game, choice, point)
                 self.game_actors.append(creature)
 
     def place_boss(self, room):
         position = room.center()
-        bosses = filter(lambda m: m['type'] == 'boss', objects.MONSTER_TEMPLATES)
+        bosses = objects.MONSTERS.of_type('boss')
         if len(bosses) == 0:
             return
 
         # Randomly select a boss and place it near the center of the room
-        boss = bosses[libtcod.random_get_int(0, 0, len(bosses)-1)]
-        boss = objects.new_monster(self._game, boss['id'], random_point_surrounding(position))
+        boss = bosses[libtcod.random_get_int(self._rng, 0, len(bosses)-1)]
+        boss = objects.new_monster(self._game, boss['id'], random_point_surrounding(position, self._rng))
         self.game_actors.append(boss)
 
     def place_items(self, room):
         # Random number of items
-        max_items = from_dungeon_level([[1, 1], [2, 4]], self._game.dungeon_level)
-        num_items = libtcod.random_get_int(0, 0, max_items)
-        item_chances = get_spawn_chances(objects.ITEM_TEMPLATES, self._game.dungeon_level)
+        max_items = from_dungeon_level([[1, 1], [2, 4]], self.dungeon_level)
+        num_items = libtcod.random_get_int(self._rng, 0, max_items)
+        item_chances = objects.ITEMS.spawn_chances(self.dungeon_level)
 
         for i in range(num_items):
             # Random position for item
-            point = room.random_point_inside()
+            point = room.random_point_inside(self._rng)
 
-            if not is_blocked(self.map, self.game_actors, point):
-                choice = random_choice(item_chances)
+            if not self.is_blocked(point):
+                choice = random_choice(item_chances, self._rng)
                 item = objects.new_item(choice, point)
                 self.game_items.append(item)
 
     def place_doors(self):
         # Look for tunnelled walls as potential doors
-        for x in range(self.map.width):
-            for y in range(self.map.height):
-                if self.meta_map[x][y].tunnelled:
-                    # Don't place doors next to other doors
-                    door_above = self.meta_map[x][y+1].tunnelled
-                    door_below = self.meta_map[x][y-1].tunnelled
-                    door_left = self.meta_map[x-1][y].tunnelled
-                    door_right = self.meta_map[x+1][y].tunnelled
-                    if door_above or door_below or door_left or door_right:
-                        continue
-
-                    # Make sure to place doors between two walls
-                    wall_above = self.meta_map[x][y+1].room_wall
-                    wall_below = self.meta_map[x][y-1].room_wall
-                    wall_left = self.meta_map[x-1][y].room_wall
-                    wall_right = self.meta_map[x+1][y].room_wall
-                    if (wall_above and wall_below) or (wall_left and wall_right):
-                        self.map.tiles[x][y].type = Tile.TYPE_CLOSED_DOOR
-
-
-def random_choice_index(chances):
+        width = self.map.width
+        tunnelled = self.tunnelled
+        walls = self.room_walls
+        for i in range(len(tunnelled)):
+            if tunnelled[i]:
+                # Don't place doors next to other doors
+                if tunnelled[i+width] or tunnelled[i-width] or tunnelled[i-1] or tunnelled[i+1]:
+                    continue
+
+                # Make sure to place doors between two walls
+                if (walls[i+width] and walls[i-width]) or (walls[i-1] and walls[i+1]):
+                    self.map.set_tile_type_at(i % width, i // width, Tile.TYPE_CLOSED_DOOR)
+
+
+def random_choice_index(chances, rng=0):
     # Choose an option from the list, returning its index
-    dice = libtcod.random_get_int(0, 1, sum(chances))
+    dice = libtcod.random_get_int(rng, 1, sum(chances))
 
     running_sum = 0
     choice = 0
@@ -267,40 +378,20 @@ def random_choice_index(chances):
         choice += 1
 
 
-def random_choice(chances_dict):
-    # Choose one option from dictionary of chances, returning its key
-    choices = chances_dict.keys()
-    chances = chances_dict.values()
-    return choices[random_choice_index(chances)]
-
-
-def from_dungeon_level(table, dungeon_level):
-    # Returns a value that depends on the dungeon level. The table specifies
-    # what value occurs after each level. Default is 0.
-    for (value, level) in reversed(table):
-        if dungeon_level >= level:
-            return value
-    return 0
+def random_choice(chances_dict, rng=0):
+    # Choose one option from dictionary of chances, returning its key. The
+    # keys are sorted so the choice doesn't depend on the dictionary order.
+    choices = sorted(chances_dict)
+    chances = [chances_dict[choice] for choice in choices]
+    return choices[random_choice_index(chances, rng)]
 
 
-def get_spawn_chances(templates, dungeon_level):
-    chances = {}
-    for t in templates:
-        if 'spawn' in t:
-            chance = t['spawn']
-            if isinstance(chance, list):
-                chances[t['id']] = from_dungeon_level(chance, dungeon_level)
-            else:
-                chances[t['id']] = chance
-    return chances
-
-
-def random_point_surrounding(position):
-    p = Position(libtcod.random_get_int(0, position.x-1, position.x+1),
-                 libtcod.random_get_int(0, position.y-1, position.y+1))
+def random_point_surrounding(position, rng=0):
+    p = Position(libtcod.random_get_int(rng, position.x-1, position.x+1),
+                 libtcod.random_get_int(rng, position.y-1, position.y+1))
     while p.x == position.x and p.y == position.y:
-        p = Position(libtcod.random_get_int(0, position.x-1, position.x+1),
-                     libtcod.random_get_int(0, position.y-1, position.y+1))
+        p = Position(libtcod.random_get_int(rng, position.x-1, position.x+1),
+                     libtcod.random_get_int(rng, position.y-1, position.y+1))
     return p
 
 
@@ -311,28 +402,130 @@ def room_overlaps_existing(room, existing):
     return False
 
 
-def randomly_placed_rect(game_map):
+def randomly_placed_rect(game_map, rng=0):
     # Random width and height
-    w = libtcod.random_get_int(0, ROOM_MIN_SIZE, ROOM_MAX_SIZE)
-    h = libtcod.random_get_int(0, ROOM_MIN_SIZE, ROOM_MAX_SIZE)
+    w = libtcod.random_get_int(rng, ROOM_MIN_SIZE, ROOM_MAX_SIZE)
+    h = libtcod.random_get_int(rng, ROOM_MIN_SIZE, ROOM_MAX_SIZE)
 
     # Random position without going out of the boundaries of the map
-    x = libtcod.random_get_int(0, 0, game_map.width - w - 1)
-    y = libtcod.random_get_int(0, 0, game_map.height - h - 1)
+    x = libtcod.random_get_int(rng, 0, game_map.width - w - 1)
+    y = libtcod.random_get_int(rng, 0, game_map.height - h - 1)
 
     return Rect(x, y, w, h)
 
 
-def make_map(game):
-    actors = [game.player]
+class Level:
+    """A generated level, ready to be installed into its game."""
+    def __init__(self, dungeon_level, stage, start):
+        self.dungeon_level = dungeon_level
+        self.stage = stage
+        self.start = start
+
+
+class LevelPregenerator:
+    """Generates the level below the game's current one in a background
+    thread, so that taking the stairs doesn't have to wait for it.
+
+    The thread only ever uses a random generator of its own: the level's
+    seed comes from the game's seed if it has one, or else is drawn from the
+    global generator up front."""
+    def __init__(self, game):
+        self.dungeon_level = game.dungeon_level + 1
+        if game.seed is not None:
+            seed = level_seed(game.seed, self.dungeon_level)
+        else:
+            seed = libtcod.random_get_int(0, 0, 0x7FFFFFFF)
+        self._level = None
+        self._thread = threading.Thread(target=self._generate, args=(game, seed))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _generate(self, game, seed):
+        # On failure there is just no level, and descending generates one
+        try:
+            self._level = generate_level(game, self.dungeon_level, seed=seed)
+        except Exception:
+            _log.exception('Pregenerating dungeon level %d failed', self.dungeon_level)
+
+    def take(self):
+        """Returns the generated level, waiting for it if it isn't done yet,
+        or None if generation failed."""
+        self._thread.join()
+        return self._level
+
+
+def pregenerate_next_level(game):
+    game.next_level = LevelPregenerator(game)
+
+
+def descend(game):
+    # Advance to the next level
+    # Heal the player by 50%
+    game.log.message('{1} take[s] a moment to rest, and recover strength.', game.player)
+    game.player.heal(game.player.max_hp / 2)
+
+    msg = 'After a rare moment of peace, {1} descend deeper into the heart of the dungeon...'
+    game.log.message(msg, game.player)
+    game.dungeon_level += 1
+    game.reseed()
+
+    # Use the level generated in the background if there is one for here
+    level = None
+    if game.next_level and game.next_level.dungeon_level == game.dungeon_level:
+        level = game.next_level.take()
+    game.next_level = None
+
+    if level:
+        install_level(game, level)
+    else:
+        make_map(game)
+
+
+def level_seed(seed, dungeon_level):
+    """Derives the seed of a dungeon level from the seed of the game."""
+    return (seed * 1000003 + dungeon_level) & 0xFFFFFFFF
+
+
+def make_map(game, width=MAP_WIDTH, height=MAP_HEIGHT, max_rooms=MAX_ROOMS, seed=None):
+    """Generates and installs the level for the game's dungeon level."""
+    install_level(game, generate_level(game, game.dungeon_level, width, height, max_rooms, seed))
+
+
+def install_level(game, level):
+    """Makes the level the game's stage, with the hero at its start."""
+    game.player.pos.copy(level.start)
+    level.stage.add_hero(game.player)
+    game.stage, old_stage = level.stage, game.stage
+    old_stage.close()
+
+
+def generate_level(game, dungeon_level, width=MAP_WIDTH, height=MAP_HEIGHT, max_rooms=MAX_ROOMS,
+                   seed=None):
+    """Generates a dungeon level of the game, without changing the game.
+    The same seed always generates the same level: the tiles, monsters and
+    items. If no seed is given, the level's seed is derived from the game's
+    seed, and if the game has none either, the global random generator is
+    used."""
+    if seed is None and game.seed is not None:
+        seed = level_seed(game.seed, dungeon_level)
+    rng = 0 if seed is None else libtcod.random_new_from_seed(seed)
+    try:
+        return _generate_level(game, dungeon_level, width, height, max_rooms, rng)
+    finally:
+        if rng:
+            libtcod.random_delete(rng)
+
+
+def _generate_level(game, dungeon_level, width, height, max_rooms, rng):
+    actors = []
     items = []
-    game_map = Map(MAP_HEIGHT, MAP_WIDTH)
-    builder = LevelBuilder(game, game_map, actors, items)
+    game_map = Map(height, width)
+    builder = LevelBuilder(game, dungeon_level, game_map, actors, items, rng)
     rooms = []
     num_rooms = 0
 
-    for r in range(MAX_ROOMS):
-        room = randomly_placed_rect(game_map)
+    for r in range(max_rooms):
+        room = randomly_placed_rect(game_map, rng)
 
         # Throw the new room away if it overlaps with an existing one
         if room_overlaps_existing(room, rooms):
@@ -343,7 +536,7 @@ def make_map(game):
 
         if num_rooms == 0:
             # This is the first room, where the player starts at
-            game.player.pos.copy(room.center())
+            builder.start = room.center()
         else:
             # Connect it to the previous room with a tunnel
             builder.create_tunnel_to(rooms[num_rooms - 1], room)
@@ -365,4 +558,5 @@ def make_map(game):
     builder.place_boss(final_room)
 
     # Finalize level generation
-    builder.finalize()
+    stage = builder.finalize()
+    return Level(dungeon_level, stage, builder.start)
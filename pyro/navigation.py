@@ -0,0 +1,149 @@
+import libtcodpy as libtcod
+from pyro.direction import Direction
+
+
+# The 1.41 is the normal diagonal cost of moving, it can be set as 0.0
+# if diagonal moves are prohibited
+DIAGONAL_COST = 1.41
+
+
+class NavigationGrid:
+    """A long-lived pathfinding map for a Stage.
+
+    Mirrors the walkability of the map's tiles, with every cell occupied by an
+    actor marked as blocked so paths navigate around them. It is updated
+    incrementally as tiles change and actors move, and the path handle is
+    reused between searches, so finding a path costs only the search itself.
+    """
+    def __init__(self, game_map, actors):
+        self._map = game_map
+        self._occupants = bytearray(game_map.width * game_map.height)
+        for actor in actors:
+            self._occupants[game_map.index(actor.pos.x, actor.pos.y)] += 1
+
+        self.nav_map = libtcod.map_new(game_map.width, game_map.height)
+        for y in range(game_map.height):
+            for x in range(game_map.width):
+                self._update(x, y)
+        self._path = libtcod.path_new_using_map(self.nav_map, DIAGONAL_COST)
+
+        game_map.add_listener(self._update)
+
+    def close(self):
+        """Frees the libtcod map and path, once the stage is no longer
+        played."""
+        if self._path is not None:
+            libtcod.path_delete(self._path)
+            libtcod.map_delete(self.nav_map)
+            self._path = self.nav_map = None
+
+    def _update(self, x, y):
+        i = self._map.index(x, y)
+        walkable = self._map.passable[i] and not self._occupants[i]
+        libtcod.map_set_properties(self.nav_map, x, y, self._map.transparent[i], walkable)
+
+    def is_walkable(self, x, y):
+        i = self._map.index(x, y)
+        return self._map.passable[i] and not self._occupants[i]
+
+    def actor_added(self, position):
+        self._occupants[self._map.index(position.x, position.y)] += 1
+        self._update(position.x, position.y)
+
+    def actor_removed(self, position):
+        self._occupants[self._map.index(position.x, position.y)] -= 1
+        self._update(position.x, position.y)
+
+    def actor_moved(self, from_pos, to_pos):
+        self.actor_removed(from_pos)
+        self.actor_added(to_pos)
+
+    def next_step(self, from_pos, to_pos, max_length):
+        """Returns the (x, y) of the first step on the path between the two
+        positions, or None if there is no path shorter than max_length.
+
+        The destination is treated as free even when an actor stands on it,
+        so that actors can find their way to each other."""
+        occupied = self._occupants[self._map.index(to_pos.x, to_pos.y)]
+        if occupied:
+            libtcod.map_set_properties(self.nav_map, to_pos.x, to_pos.y,
+                                       not self._map.vision_blocked(to_pos.x, to_pos.y),
+                                       not self._map.movement_blocked(to_pos.x, to_pos.y))
+        try:
+            libtcod.path_compute(self._path, from_pos.x, from_pos.y, to_pos.x, to_pos.y)
+            if libtcod.path_is_empty(self._path) or libtcod.path_size(self._path) >= max_length:
+                return None
+            next_x, next_y = libtcod.path_walk(self._path, True)
+            if next_x is None:
+                return None
+            return next_x, next_y
+        finally:
+            if occupied:
+                self._update(to_pos.x, to_pos.y)
+
+
+class DistanceMap:
+    """Walking distances from one origin to every cell of the map.
+
+    Every monster chasing the hero wants to go to the same place, so rather
+    than each one searching for its own path, a single Dijkstra field is
+    computed from the hero whenever the hero moves (or a tile changes) and
+    each monster just steps to whichever neighboring cell is closest.
+
+    The field only considers tiles, using the map's FOV map for walkability
+    unless another libtcod map is given. Actors move around too often to be
+    part of it; they are accounted for when choosing a step instead."""
+    def __init__(self, game_map, walkability=None):
+        self._map = game_map
+        self._walkability = walkability
+        self._dijkstra = None
+        self._origin = None
+        game_map.add_listener(self._tile_changed)
+
+    def _tile_changed(self, x, y):
+        self._origin = None
+
+    def close(self):
+        """Frees the libtcod Dijkstra field, once the stage is no longer
+        played. The walkability map is left to whoever gave it."""
+        if self._dijkstra is not None:
+            libtcod.dijkstra_delete(self._dijkstra)
+            self._dijkstra = None
+            self._origin = None
+
+    def _refresh(self, origin):
+        if self._origin == (origin.x, origin.y):
+            return
+        self._map.flush_properties()
+        if self._dijkstra is None:
+            walkability = self._walkability or self._map.fov_map
+            self._dijkstra = libtcod.dijkstra_new(walkability, DIAGONAL_COST)
+        libtcod.dijkstra_compute(self._dijkstra, origin.x, origin.y)
+        self._origin = (origin.x, origin.y)
+
+    def distance(self, origin, x, y):
+        """Returns the walking distance from (x, y) to the origin, or -1 if
+        it can't be reached."""
+        self._refresh(origin)
+        return libtcod.dijkstra_get_distance(self._dijkstra, x, y)
+
+    def step_towards(self, origin, position, is_free, max_distance):
+        """Returns the Direction that brings position closest to origin
+        through a cell for which is_free(x, y) is true, or None if no step
+        gets any closer or origin is max_distance or more away."""
+        self._refresh(origin)
+        best_distance = libtcod.dijkstra_get_distance(self._dijkstra, position.x, position.y)
+        if best_distance < 0 or best_distance >= max_distance:
+            return None
+
+        best = None
+        for direction in Direction.ALL:
+            x = position.x + direction.x
+            y = position.y + direction.y
+            if not (0 <= x < self._map.width and 0 <= y < self._map.height):
+                continue
+            distance = libtcod.dijkstra_get_distance(self._dijkstra, x, y)
+            if 0 <= distance < best_distance and is_free(x, y):
+                best_distance = distance
+                best = direction
+        return best
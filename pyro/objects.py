@@ -1,82 +1,143 @@
 import os
 import json
+import cPickle
 import libtcodpy as libtcod
 from pyro.engine.item import Item
 from pyro.engine.glyph import glyph
 from pyro.spells import Confuse, Fireball, Heal, LightningBolt
 from pyro.engine import ai, Hero, Monster
+from pyro.templates import TemplateRegistry
 
 
-def new_player(game):
+def new_player(game, starting_items=True):
+    """Without starting items, the hero's inventory is left empty, e.g. to
+    be filled from a saved game."""
+    template = _player_template()
     hero = Hero(game)
-    hero.name = PLAYER_TEMPLATE['name']
+    hero.name = template['name']
     hero.inventory = []
-    hero.glyph = glyph(PLAYER_TEMPLATE['glyph'],
-                       getattr(libtcod, PLAYER_TEMPLATE['color']))
-    hero.hp = PLAYER_TEMPLATE['hp']
+    hero.glyph = glyph(template['glyph'],
+                       getattr(libtcod, template['color']))
+    hero.hp = template['hp']
     hero.base_max_hp = hero.hp
-    hero.base_defense = PLAYER_TEMPLATE['defense']
-    hero.base_power = PLAYER_TEMPLATE['power']
+    hero.base_defense = template['defense']
+    hero.base_power = template['power']
     game.player = hero
-    for i in PLAYER_TEMPLATE['starting_items']:
+    for i in template['starting_items'] if starting_items else []:
         # TODO Don't reimplement this here
         item = new_item(i)
         item.owner = hero
         hero.inventory.append(item)
         if item.can_equip():
             item.is_equipped = True
+    hero.equipment_changed()
     return hero
 
 
 def new_monster(game, monster_id, position=None):
-    for template in MONSTER_TEMPLATES:
-        if template['id'] == monster_id:
-            monster = _instantiate_monster(game, template)
-            if position:
-                monster.pos.copy(position)
-            return monster
-    return None
+    factory = MONSTERS.factory(monster_id)
+    if factory is None:
+        return None
+    monster = factory.create(game)
+    if position:
+        monster.pos.copy(position)
+    return monster
 
 
 def new_item(item_id, position=None):
-    for template in ITEM_TEMPLATES:
-        if template['id'] == item_id:
-            item = _instantiate_item(template)
-            if position:
-                item.pos.copy(position)
-            return item
-    return None
+    factory = ITEMS.factory(item_id)
+    if factory is None:
+        return None
+    item = factory.create()
+    if position:
+        item.pos.copy(position)
+    return item
+
+
+# Bump whenever _parse_templates changes what it returns, to invalidate
+# the caches
+_CACHE_VERSION = 1
 
 
 def _load_templates(json_file):
+    """Loads the templates from a pickled cache next to the JSON file, as
+    long as the JSON file hasn't changed since the cache was written.
+    Otherwise the JSON file is parsed and the cache rewritten."""
+    stat = os.stat(json_file)
+    key = (_CACHE_VERSION, os.path.abspath(json_file), stat.st_size, stat.st_mtime)
+    cache_file = json_file + '.cache'
+
+    try:
+        with open(cache_file, 'rb') as f:
+            if cPickle.load(f) == key:
+                return cPickle.load(f)
+    except Exception:
+        # Missing, unreadable or corrupt; any of these just means a miss
+        pass
+
+    templates = _parse_templates(json_file)
+    # Write and rename so that concurrent processes never read half a cache
+    temp_file = '%s.%d' % (cache_file, os.getpid())
+    try:
+        with open(temp_file, 'wb') as f:
+            cPickle.dump(key, f, cPickle.HIGHEST_PROTOCOL)
+            cPickle.dump(templates, f, cPickle.HIGHEST_PROTOCOL)
+        _replace(temp_file, cache_file)
+    except (IOError, OSError, cPickle.PicklingError):
+        # The content may be on a read-only file system
+        try:
+            os.remove(temp_file)
+        except OSError:
+            pass
+    return templates
+
+
+def _replace(source, destination):
+    try:
+        # Atomic where the destination can be replaced (POSIX), so the old
+        # cache stays readable until the new one takes its place
+        os.rename(source, destination)
+    except OSError:
+        # Windows won't rename over an existing file
+        if not os.path.exists(destination):
+            raise
+        os.remove(destination)
+        os.rename(source, destination)
+
+
+def _parse_templates(json_file):
     with open(json_file) as f:
         templates = json.load(f)
 
+    for template in templates if type(templates) is list else [templates]:
+        if 'glyph' not in template:
+            raise ValueError('{0}: template {1} has no glyph'.format(
+                json_file, template.get('id', template.get('name'))))
+
         # For some reason the UI renderer can't handle Unicode strings so we
         # need to convert the character glyph to UTF-8 for it to be rendered
-        if type(templates) is list:
-            for t in templates:
-                t['glyph'] = str(t['glyph'])
-        elif type(templates) is dict:
-            templates['glyph'] = str(templates['glyph'])
+        template['glyph'] = str(template['glyph'])
+
+    return templates
+
+
+def _load_monsters():
+    return _load_templates(os.environ.get('MONSTER_TEMPLATES', 'resources/monsters.json'))
 
-        return templates
 
+def _load_items():
+    return _load_templates(os.environ.get('ITEM_TEMPLATES', 'resources/items.json'))
 
-if 'MONSTER_TEMPLATES' in os.environ:
-    MONSTER_TEMPLATES = _load_templates(os.environ['MONSTER_TEMPLATES'])
-else:
-    MONSTER_TEMPLATES = _load_templates('resources/monsters.json')
 
-if 'ITEM_TEMPLATES' in os.environ:
-    ITEM_TEMPLATES = _load_templates(os.environ['ITEM_TEMPLATES'])
-else:
-    ITEM_TEMPLATES = _load_templates('resources/items.json')
+_player = None
 
-if 'PLAYER_TEMPLATE' in os.environ:
-    PLAYER_TEMPLATE = _load_templates(os.environ['PLAYER_TEMPLATE'])
-else:
-    PLAYER_TEMPLATE = _load_templates('resources/player.json')
+
+def _player_template():
+    # Loaded on first use, like the monster and item templates
+    global _player
+    if _player is None:
+        _player = _load_templates(os.environ.get('PLAYER_TEMPLATE', 'resources/player.json'))
+    return _player
 
 
 SPELLS = dict(
@@ -94,42 +155,63 @@ ITEM_USES = dict(
 )
 
 
-def _instantiate_monster(game, template):
-    name = template['name']
-    spells = None
-    if 'spell' in template:
-        spells = [_instantiate_spell(template['spell'])]
-    elif 'spells' in template:
-        spells = [_instantiate_spell(spell) for spell in template['spells']]
-    monster = Monster(game)
-    monster.name = name
-    monster.ai = ai.new(template['ai'], spells)
-    monster.ai.monster = monster
-    monster.glyph = glyph(template['glyph'], getattr(libtcod, template['color']))
-    monster.xp = template['experience']
-    monster.hp = template['hp']
-    monster.base_max_hp = monster.hp
-    monster.base_defense = template['defense']
-    monster.base_power = template['power']
-    return monster
-
-
-def _instantiate_item(template):
-    name = template['name']
-    glyph_ = glyph(template['glyph'], getattr(libtcod, template['color']))
-    item = Item(name, glyph_)
-    if 'slot' in template:
-        item.equip_slot = template['slot']
-        if 'power' in template:
-            item.power_bonus = template['power']
-        if 'defense' in template:
-            item.defense_bonus = template['defense']
-        if 'hp' in template:
-            item.max_hp_bonus = template['hp']
-    elif 'on_use' in template:
-        spell = _instantiate_spell(ITEM_USES[template['on_use']])
-        item.on_use = spell
-    return item
+class _MonsterFactory:
+    """Creates monsters from a template, with everything that doesn't vary
+    between them (glyph, spells) built only once. Spells are shared, as
+    they never change once configured."""
+    def __init__(self, template):
+        self.template_id = template['id']
+        self.name = template['name']
+        self.ai = template['ai']
+        self.spells = None
+        if 'spell' in template:
+            self.spells = [_instantiate_spell(template['spell'])]
+        elif 'spells' in template:
+            self.spells = [_instantiate_spell(spell) for spell in template['spells']]
+        self.glyph = glyph(template['glyph'], getattr(libtcod, template['color']))
+        self.xp = template['experience']
+        self.hp = template['hp']
+        self.defense = template['defense']
+        self.power = template['power']
+
+    def create(self, game):
+        monster = Monster(game)
+        monster.template_id = self.template_id
+        monster.name = self.name
+        monster.ai = ai.new(self.ai, self.spells)
+        monster.ai.monster = monster
+        monster.glyph = self.glyph
+        monster.xp = self.xp
+        monster.hp = self.hp
+        monster.base_max_hp = self.hp
+        monster.base_defense = self.defense
+        monster.base_power = self.power
+        return monster
+
+
+class _ItemFactory:
+    """Creates items from a template, with the glyph and spell built only
+    once."""
+    def __init__(self, template):
+        self.template_id = template['id']
+        self.name = template['name']
+        self.glyph = glyph(template['glyph'], getattr(libtcod, template['color']))
+        self.equip_slot = template.get('slot')
+        self.power_bonus = template.get('power', 0)
+        self.defense_bonus = template.get('defense', 0)
+        self.max_hp_bonus = template.get('hp', 0)
+        self.on_use = None
+        if self.equip_slot is None and 'on_use' in template:
+            self.on_use = _instantiate_spell(ITEM_USES[template['on_use']])
+
+    def create(self):
+        item = Item(self.name, self.glyph, self.on_use, self.equip_slot)
+        item.template_id = self.template_id
+        if self.equip_slot:
+            item.power_bonus = self.power_bonus
+            item.defense_bonus = self.defense_bonus
+            item.max_hp_bonus = self.max_hp_bonus
+        return item
 
 
 def _instantiate_spell(template):
@@ -139,3 +221,7 @@ def _instantiate_spell(template):
     else:
         spell = SPELLS[template]()
     return spell
+
+
+MONSTERS = TemplateRegistry(_load_monsters, _MonsterFactory)
+ITEMS = TemplateRegistry(_load_items, _ItemFactory)
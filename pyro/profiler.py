@@ -0,0 +1,126 @@
+"""Where the time of each turn goes.
+
+A game given a Profiler (as game.profiler) times these sections of
+Game.update and what it calls, by name:
+
+    action.<class>          Action.perform, by the class of the action
+    ai.<class>              AI.take_turn, by the class of the behavior
+    visibility              Map.refresh_visibility
+    pathfinding.astar       A* steps (through the navigation grid)
+    pathfinding.distance    steps down the stage's distance map
+
+Sections nest: a monster's turn is an AIAdapterAction, which includes its
+AI, which includes its pathfinding. Each timing goes into a histogram of
+the section's calls, and each hero turn the time spent in every section
+during it goes into a histogram of the section's turns.
+
+Without a profiler, each of these costs no more than checking for one:
+
+    python -m pyro.headless --turns 5000 --profile profile.json
+"""
+import json
+import timeit
+
+
+_clock = timeit.default_timer
+
+# Histogram bucket i counts the timings of less than 2**i microseconds (and,
+# but for the first, at least 2**(i-1)); the last one counts everything above
+HISTOGRAM_BUCKETS = 24
+
+
+class Histogram:
+    """Timings, in seconds, in buckets of powers of two of microseconds."""
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * HISTOGRAM_BUCKETS
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.buckets[min(int(seconds * 1000000).bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, p):
+        """Returns an upper bound, in seconds, of the p-th percentile: the top
+        of the bucket it falls in (or the longest timing, if less)."""
+        rank = self.count * p / 100.0
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= rank:
+                return min(2 ** i / 1000000.0, self.max)
+        return self.max
+
+    def to_dict(self):
+        # Buckets past the last used one are left out
+        used = max([i + 1 for i, n in enumerate(self.buckets) if n] or [0])
+        return dict(
+            count=self.count,
+            total=self.total,
+            mean=self.mean(),
+            max=self.max,
+            p50=self.percentile(50),
+            p90=self.percentile(90),
+            p99=self.percentile(99),
+            buckets=self.buckets[:used],
+        )
+
+
+class Profiler:
+    def __init__(self):
+        # A Histogram of the calls and one of the turns of each section
+        self.calls = {}
+        self.turns = {}
+        # The number of hero turns ended
+        self.turn_count = 0
+        self._turn = {}
+
+    def call(self, section, fn, *args):
+        """Returns fn(*args), timed as a call of the section."""
+        start = _clock()
+        result = fn(*args)
+        self.add(section, _clock() - start)
+        return result
+
+    def add(self, section, seconds):
+        histogram = self.calls.get(section)
+        if histogram is None:
+            histogram = self.calls[section] = Histogram()
+        histogram.add(seconds)
+        self._turn[section] = self._turn.get(section, 0.0) + seconds
+
+    def end_turn(self):
+        """Closes the hero turn: every section seen so far gets a timing for
+        it, of nothing if it wasn't called."""
+        for section in self.calls:
+            histogram = self.turns.get(section)
+            if histogram is None:
+                # A new section didn't take any time in the turns before
+                histogram = self.turns[section] = Histogram()
+                histogram.buckets[0] = histogram.count = self.turn_count
+            histogram.add(self._turn.get(section, 0.0))
+        self._turn = {}
+        self.turn_count += 1
+
+    def reset(self):
+        self.__init__()
+
+    def stats(self):
+        empty = Histogram()
+        return dict(
+            turns=self.turn_count,
+            sections=dict((section, dict(calls=histogram.to_dict(),
+                                         turns=self.turns.get(section, empty).to_dict()))
+                          for section, histogram in self.calls.iteritems()),
+        )
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.stats(), f, indent=2, sort_keys=True)
@@ -0,0 +1,91 @@
+"""Recordings of games, for playing them back.
+
+A game is reproducible from its seed and the player's inputs, so that is
+all a recording holds: a header line with the seed of a game started from
+the menu, followed by a line for each input GameScreen handled and for each
+screen closed over it (with the menu, target or pause selection it
+returned, if any), all as JSON. Each of these notes how many times the game
+had been updated when it happened, so that playing it back can hand it over
+at the same point.
+
+Recordings are written a line at a time, so one from a session that crashed
+is still good up to the crash. pyro.headless plays them back:
+
+    PYRO_RECORDING=game.jsonl python -m pyro.main
+    python -m pyro.headless --replay game.jsonl
+"""
+import json
+from pyro.position import Position
+from pyro.target import Target
+from pyro.ui.menu_screen import MenuSelection
+
+
+RECORDING_VERSION = 1
+
+
+class Recorder:
+    def __init__(self, path, game):
+        self._file = open(path, 'w')
+        self._write(dict(version=RECORDING_VERSION, seed=game.seed))
+
+    def input(self, updates, input_):
+        self._write(dict(update=updates, input=input_))
+
+    def result(self, updates, tag, result):
+        self._write(dict(update=updates, tag=tag, result=_encode_result(result)))
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def _write(self, entry):
+        if self._file:
+            self._file.write(json.dumps(entry, sort_keys=True) + '\n')
+            self._file.flush()
+
+
+def read_recording(path):
+    """Returns the header and the list of events of the recording. A last
+    line cut short by a crash is ignored."""
+    with open(path) as f:
+        lines = f.readlines()
+    header = json.loads(lines[0])
+    if header.get('version') != RECORDING_VERSION:
+        raise ValueError('Recording has version {0}, expected {1}'.format(
+            header.get('version'), RECORDING_VERSION))
+    if header.get('seed') is None:
+        raise ValueError('Recording has no seed')
+    events = []
+    for line in lines[1:]:
+        try:
+            events.append(json.loads(line))
+        except ValueError:
+            break
+    return header, events
+
+
+def decode_result(result, screen, game):
+    """Returns what the screen the result was recorded from (now the top
+    screen) returned."""
+    if result is None:
+        return None
+    elif 'selection' in result:
+        return screen.selection(result['selection'])
+    elif 'target' in result:
+        x, y = result['target']
+        target = Target(position=Position(x, y))
+        if result['actor']:
+            target.actor = game.stage.actor_at(target.position)
+        return target
+    return result['index']
+
+
+def _encode_result(result):
+    if result is None:
+        return None
+    elif isinstance(result, MenuSelection):
+        return dict(selection=result.index)
+    elif isinstance(result, Target):
+        return dict(target=[result.pos.x, result.pos.y], actor=result.actor is not None)
+    return dict(index=result)
@@ -0,0 +1,769 @@
+"""Saving and loading games.
+
+A save is a small header followed by the zlib-compressed state of the game.
+The state is written with struct rather than pickled: the tile types and
+explored flags of the map are stored as the raw bytes of their planes, and
+each actor, item, corpse and message as a fixed record plus its strings.
+Monsters and items are saved by template id and rebuilt from the template
+factories, so only what can change during play is stored.
+
+Between saves, a Journal appends what changed during each hero turn, which
+loading replays on top of the save.
+
+The state of the game's random generator isn't saved: it is reseeded from
+the turn, just as the game does at the end of every hero turn.
+
+Tile types are saved by id, so FORMAT_VERSION must be bumped whenever the
+tile types or anything saved here change.
+"""
+import os
+import struct
+import zlib
+from array import array
+from itertools import chain
+import pyro.engine.corpse
+from pyro import objects
+from pyro.engine import Hero
+from pyro.engine.ai import Aggressive, AggressiveSpellcaster, PassiveAggressive, Confused
+from pyro.engine.element import Elements
+from pyro.engine.game import Game, Stage
+from pyro.engine.log import Message
+from pyro.engine.scheduler import EnergyQueue
+from pyro.map import Map
+from pyro.position import Position
+from pyro.settings import JOURNAL_COMPACT_TURNS, MSG_HEIGHT
+from pyro.tile import Tile
+
+
+MAGIC = 'PYRO'
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct('<4sH')
+_COUNT = struct.Struct('<I')
+_STRING = struct.Struct('<H')
+# Dungeon level, whether there is a seed, the seed, turn and (round-robin)
+# current actor
+_GAME = struct.Struct('<HBqIH')
+_MAP = struct.Struct('<HH')
+# Kind, x, y, energy, hp, base max hp, base defense, base power, xp, level
+_ACTOR = struct.Struct('<BhhiiiiiiH')
+# x, y, equipped
+_ITEM = struct.Struct('<hhB')
+# Kind, x, y
+_CORPSE = struct.Struct('<Bhh')
+_BEHAVIOR = struct.Struct('<B')
+_TARGET = struct.Struct('<h')
+_TURNS = struct.Struct('<i')
+
+_ACTOR_HERO = 0
+_ACTOR_MONSTER = 1
+
+_BEHAVIOR_NONE = 0
+_BEHAVIOR_AGGRESSIVE = 1
+_BEHAVIOR_AGGRESSIVE_SPELLCASTER = 2
+_BEHAVIOR_PASSIVE_AGGRESSIVE = 3
+_BEHAVIOR_CONFUSED = 4
+
+_BEHAVIORS = {
+    AggressiveSpellcaster: _BEHAVIOR_AGGRESSIVE_SPELLCASTER,
+    PassiveAggressive: _BEHAVIOR_PASSIVE_AGGRESSIVE,
+}
+
+_ELEMENTS = dict((element.name, element) for element in (Elements.LIGHTNING, Elements.FIRE))
+
+# Turn the bytes of a types plane into the passable and transparent planes
+_PASSABLE = bytes(bytearray(int(t.passable) for t in Tile.TYPES) +
+                  bytearray(256 - len(Tile.TYPES)))
+_TRANSPARENT = bytes(bytearray(int(t.transparent) for t in Tile.TYPES) +
+                     bytearray(256 - len(Tile.TYPES)))
+
+
+def save_game(game, path):
+    """Writes the game to the file, replacing any previous save. The file is
+    written under another name and renamed, so that a failed save never
+    leaves a broken one behind."""
+    _write_file(path, dumps(game))
+
+
+def _write_file(path, data):
+    temp_file = '%s.%d' % (path, os.getpid())
+    try:
+        with open(temp_file, 'wb') as f:
+            f.write(data)
+        objects._replace(temp_file, path)
+    except (IOError, OSError):
+        # The error is the caller's to report, but the partial file is ours
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+
+
+def load_game(path):
+    """Returns the Game saved in the file, along with whatever its Journal
+    recorded since. Raises ValueError if the file isn't a save of this
+    version."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    game = loads(data)
+    _replay(game, path + JOURNAL_SUFFIX, zlib.crc32(data) & 0xFFFFFFFF)
+    # The journal may have moved the game on to a later turn
+    game.reseed()
+    return game
+
+
+def dumps(game):
+    """Returns the game, which must have a living hero, as a string. Actions
+    in progress are not saved, so this is meant for between the hero's
+    turns."""
+    writer = _Writer()
+    _write_game(writer, game)
+    return _HEADER.pack(MAGIC, FORMAT_VERSION) + zlib.compress(writer.getvalue(), 1)
+
+
+def loads(data):
+    """Returns the Game saved in the string."""
+    if len(data) < _HEADER.size:
+        raise ValueError('Not a saved game')
+    magic, version = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError('Not a saved game')
+    if version != FORMAT_VERSION:
+        raise ValueError('Saved game has version {0}, expected {1}'.format(version, FORMAT_VERSION))
+    try:
+        reader = _Reader(zlib.decompress(data[_HEADER.size:]))
+        return _read_game(reader)
+    except (zlib.error, struct.error) as e:
+        raise ValueError('Saved game is corrupt: {0}'.format(e))
+
+
+class _Writer:
+    def __init__(self):
+        self._parts = []
+
+    def pack(self, record, *values):
+        self._parts.append(record.pack(*values))
+
+    def raw(self, data):
+        self._parts.append(data)
+
+    def string(self, text):
+        if isinstance(text, unicode):
+            text = text.encode('utf-8')
+        self._parts.append(_STRING.pack(len(text)))
+        self._parts.append(text)
+
+    def getvalue(self):
+        return ''.join(self._parts)
+
+
+class _Reader:
+    def __init__(self, data):
+        self._data = data
+        self._offset = 0
+
+    def unpack(self, record):
+        values = record.unpack_from(self._data, self._offset)
+        self._offset += record.size
+        return values
+
+    def raw(self, size):
+        if self._offset + size > len(self._data):
+            raise struct.error('unexpected end of data')
+        data = self._data[self._offset:self._offset + size]
+        self._offset += size
+        return data
+
+    def string(self):
+        size, = self.unpack(_STRING)
+        return self.raw(size).decode('utf-8')
+
+    def at_end(self):
+        return self._offset >= len(self._data)
+
+
+def _write_game(writer, game):
+    stage = game.stage
+    has_seed = game.seed is not None
+    writer.pack(_GAME, game.dungeon_level, has_seed, game.seed if has_seed else 0,
+                game.turn, stage.current_actor_index)
+
+    game_map = stage.map
+    writer.pack(_MAP, game_map.width, game_map.height)
+    writer.raw(game_map.types.tostring())
+    writer.raw(str(game_map.explored))
+
+    # Actors refer to each other (e.g. the target of an aggressive monster)
+    # by their index in the stage
+    indexes = dict((id(actor), i) for i, actor in enumerate(stage.actors))
+    writer.pack(_COUNT, len(stage.actors))
+    for actor in stage.actors:
+        _write_actor(writer, actor, indexes)
+
+    writer.pack(_COUNT, len(stage.items))
+    for item in stage.items:
+        _write_item(writer, item)
+
+    writer.pack(_COUNT, len(stage.corpses))
+    for corpse in stage.corpses:
+        writer.pack(_CORPSE, _corpse_type_id(corpse.type), corpse.pos.x, corpse.pos.y)
+        writer.string(corpse.name)
+
+    writer.pack(_COUNT, len(game.log.messages))
+    for message in game.log.messages:
+        _write_message(writer, message)
+
+
+def _write_message(writer, message):
+    writer.pack(_COUNT, message.count)
+    writer.string(message.type)
+    writer.string(message.element.name if message.element else '')
+    writer.string(message.text)
+
+
+def _corpse_type_id(corpse_type):
+    # Corpse types may be equal to each other, so they are told apart by
+    # identity
+    for i, other in enumerate(pyro.engine.corpse.TYPES):
+        if other is corpse_type:
+            return i
+    raise ValueError('Unknown corpse type')
+
+
+def _write_actor(writer, actor, indexes):
+    kind = _ACTOR_HERO if isinstance(actor, Hero) else _ACTOR_MONSTER
+    writer.pack(_ACTOR, kind, actor.pos.x, actor.pos.y, actor.energy.energy, actor.hp,
+                actor.base_max_hp, actor.base_defense, actor.base_power, actor.xp, actor.level)
+    if kind == _ACTOR_HERO:
+        writer.pack(_COUNT, len(actor.inventory))
+        for item in actor.inventory:
+            _write_item(writer, item)
+    else:
+        writer.string(actor.template_id)
+        _write_behavior(writer, actor.ai.behavior, indexes)
+
+
+def _write_item(writer, item):
+    if item.template_id is None:
+        raise ValueError('Cannot save {0}, it has no template'.format(item.name))
+    writer.string(item.template_id)
+    writer.pack(_ITEM, item.pos.x, item.pos.y, item.is_equipped)
+
+
+def _write_behavior(writer, behavior, indexes):
+    # Confused monsters keep the behavior they return to, which may itself
+    # be confused, so this follows the whole chain
+    if behavior is None:
+        writer.pack(_BEHAVIOR, _BEHAVIOR_NONE)
+    elif isinstance(behavior, Confused):
+        writer.pack(_BEHAVIOR, _BEHAVIOR_CONFUSED)
+        writer.pack(_TURNS, behavior.num_turns)
+        _write_behavior(writer, behavior.restore_ai, indexes)
+    elif isinstance(behavior, Aggressive):
+        # A target that has left the stage is forgotten
+        target = indexes.get(id(behavior.target), -1) if behavior.target else -1
+        writer.pack(_BEHAVIOR, _BEHAVIOR_AGGRESSIVE)
+        writer.pack(_TARGET, target)
+    else:
+        writer.pack(_BEHAVIOR, _BEHAVIORS[behavior.__class__])
+
+
+def _read_game(reader):
+    dungeon_level, has_seed, seed, turn, current_actor_index = reader.unpack(_GAME)
+    game = Game(dungeon_level, seed if has_seed else None)
+    game.turn = turn
+    # Resumes the random generator as of the end of the last hero turn (or
+    # the arrival on the level), rather than from the start of the game
+    game.reseed()
+
+    width, height = reader.unpack(_MAP)
+    game_map = Map(height, width)
+    types = reader.raw(width * height)
+    game_map.types = array('B', types)
+    game_map.passable = bytearray(types.translate(_PASSABLE))
+    game_map.transparent = bytearray(types.translate(_TRANSPARENT))
+    game_map.explored = bytearray(reader.raw(width * height))
+
+    actors = []
+    targets = []
+    count, = reader.unpack(_COUNT)
+    for _ in range(count):
+        actors.append(_read_actor(reader, game, targets))
+    for behavior, index in targets:
+        behavior.target = actors[index]
+    if game.player is None:
+        raise ValueError('Saved game has no hero')
+
+    items = []
+    count, = reader.unpack(_COUNT)
+    for _ in range(count):
+        items.append(_read_item(reader))
+
+    stage = Stage(game_map, actors, items)
+    stage.current_actor_index = current_actor_index if current_actor_index < len(actors) else 0
+    count, = reader.unpack(_COUNT)
+    for _ in range(count):
+        kind, x, y = reader.unpack(_CORPSE)
+        stage.add_corpse(pyro.engine.corpse.Corpse(pyro.engine.corpse.TYPES[kind],
+                                                   reader.string(), Position(x, y)))
+    game.stage = stage
+
+    count, = reader.unpack(_COUNT)
+    for _ in range(count):
+        game.log.messages.append(_read_message(reader))
+
+    game_map.reset_fov()
+    game_map.refresh_visibility(game.player.pos)
+    return game
+
+
+def _read_message(reader):
+    repeats, = reader.unpack(_COUNT)
+    type_ = str(reader.string())
+    element = _ELEMENTS.get(reader.string())
+    message = Message(type_, None, element, text=reader.string())
+    message.count = repeats
+    return message
+
+
+def _read_actor(reader, game, targets):
+    kind, x, y, energy, hp, base_max_hp, base_defense, base_power, xp, level = reader.unpack(_ACTOR)
+    if kind == _ACTOR_HERO:
+        actor = objects.new_player(game, starting_items=False)
+        count, = reader.unpack(_COUNT)
+        for _ in range(count):
+            item = _read_item(reader)
+            item.owner = actor
+            actor.inventory.append(item)
+        actor.equipment_changed()
+    elif kind == _ACTOR_MONSTER:
+        template_id = reader.string()
+        actor = objects.new_monster(game, template_id)
+        if actor is None:
+            raise ValueError('Saved game has unknown monster {0}'.format(template_id))
+        actor.ai.behavior = _read_behavior(reader, targets)
+    else:
+        raise ValueError('Saved game has unknown actor kind {0}'.format(kind))
+    actor.pos.x, actor.pos.y = x, y
+    actor.energy.energy = energy
+    actor.hp = hp
+    actor.base_max_hp = base_max_hp
+    actor.base_defense = base_defense
+    actor.base_power = base_power
+    actor.xp = xp
+    actor.level = level
+    return actor
+
+
+def _read_item(reader):
+    template_id = reader.string()
+    item = objects.new_item(template_id)
+    if item is None:
+        raise ValueError('Saved game has unknown item {0}'.format(template_id))
+    item.pos.x, item.pos.y, is_equipped = reader.unpack(_ITEM)
+    item.is_equipped = bool(is_equipped)
+    return item
+
+
+def _read_behavior(reader, targets):
+    kind, = reader.unpack(_BEHAVIOR)
+    if kind == _BEHAVIOR_NONE:
+        return None
+    elif kind == _BEHAVIOR_CONFUSED:
+        num_turns, = reader.unpack(_TURNS)
+        return Confused(_read_behavior(reader, targets), num_turns)
+    elif kind == _BEHAVIOR_AGGRESSIVE:
+        behavior = Aggressive()
+        index, = reader.unpack(_TARGET)
+        if index >= 0:
+            # Resolved once every actor has been read
+            targets.append((behavior, index))
+        return behavior
+    elif kind == _BEHAVIOR_AGGRESSIVE_SPELLCASTER:
+        return AggressiveSpellcaster()
+    elif kind == _BEHAVIOR_PASSIVE_AGGRESSIVE:
+        return PassiveAggressive()
+    raise ValueError('Saved game has unknown behavior {0}'.format(kind))
+
+
+# The journal kept next to a save, and how it starts: the magic string, the
+# format version and the CRC of the save it applies to
+JOURNAL_SUFFIX = '.journal'
+JOURNAL_MAGIC = 'PYRJ'
+_JOURNAL_HEADER = struct.Struct('<4sHI')
+# Each hero turn is a frame: the size and CRC of the frame's records, then
+# the game's turn and (round-robin) current actor
+_FRAME = struct.Struct('<II')
+_TURN = struct.Struct('<IH')
+_RECORD = struct.Struct('<B')
+_ID = struct.Struct('<H')
+# x, y, type id
+_TILE = struct.Struct('<HHB')
+_CELL = struct.Struct('<HH')
+# x, y, hp, base max hp, base defense, base power, xp, level
+_ACTOR_STATE = struct.Struct('<hhiiiiiH')
+# Where an item is, x, y, equipped
+_ITEM_STATE = struct.Struct('<BhhB')
+
+_RECORD_TILE = 0
+_RECORD_EXPLORED = 1
+_RECORD_ACTOR = 2
+_RECORD_ACTOR_GONE = 3
+_RECORD_BEHAVIOR = 4
+_RECORD_ENERGY = 5
+_RECORD_ITEM = 6
+_RECORD_CORPSE = 7
+_RECORD_MESSAGE = 8
+_RECORD_REPEAT = 9
+
+_ITEM_ON_STAGE = 0
+_ITEM_HELD = 1
+_ITEM_GONE = 2
+
+
+class Journal:
+    """Keeps a save up to date by appending what changed during each hero
+    turn, rather than writing the whole game every time.
+
+    Changes are found by comparing each actor and item with how it was last
+    written, and from the cells the map reports as changed, so a turn costs
+    a frame the size of what changed. Actors and items are identified by
+    their position in the stage (items on the stage first, then the hero's)
+    when the last snapshot was taken. Once there are compact_turns frames,
+    or the stage has something the snapshot doesn't (e.g. a new level), a
+    full snapshot is taken and the journal starts over.
+
+    load_game replays the journal on top of the save, up to the last whole
+    frame, so a crash loses at most the turn being written."""
+    def __init__(self, path, compact_turns=JOURNAL_COMPACT_TURNS):
+        self.path = path
+        self._compact_turns = compact_turns
+        self._file = None
+        self._frames = 0
+        self._stage = None
+        self._ids = {}
+        self._actors = []
+        self._actor_states = []
+        self._behaviors = []
+        self._behavior_objects = []
+        self._items = []
+        self._item_states = []
+        self._explored = None
+        self._changed_tiles = set()
+        self._seen_cells = set()
+        self._corpses = 0
+        self._last_message = None
+        self._last_count = 0
+
+    def snapshot(self, game):
+        """Saves the whole game and starts a new journal on top of it."""
+        self.close()
+        data = dumps(game)
+        _write_file(self.path, data)
+        self._file = open(self.path + JOURNAL_SUFFIX, 'wb')
+        self._file.write(_JOURNAL_HEADER.pack(JOURNAL_MAGIC, FORMAT_VERSION,
+                                              zlib.crc32(data) & 0xFFFFFFFF))
+        self._file.flush()
+        self._frames = 0
+        self._track(game)
+
+    def record(self, game):
+        """Appends what changed since the last call (or snapshot). If that
+        fails, journaling stops."""
+        if self._file is None:
+            return
+        try:
+            self._record(game)
+        except (IOError, OSError):
+            self.close()
+            game.log.error('The game could not be saved.')
+
+    def _record(self, game):
+        stage = game.stage
+        if (stage is not self._stage or self._frames >= self._compact_turns or
+                self._untracked(game)):
+            self.snapshot(game)
+            return
+
+        writer = _Writer()
+        self._record_tiles(writer, stage.map)
+        self._record_actors(writer, stage)
+        self._record_items(writer, game)
+        for corpse in stage.corpses[self._corpses:]:
+            writer.pack(_RECORD, _RECORD_CORPSE)
+            writer.pack(_CORPSE, _corpse_type_id(corpse.type), corpse.pos.x, corpse.pos.y)
+            writer.string(corpse.name)
+        self._corpses = len(stage.corpses)
+        self._record_messages(writer, game.log.messages)
+
+        payload = _TURN.pack(game.turn, stage.current_actor_index) + writer.getvalue()
+        self._file.write(_FRAME.pack(len(payload), zlib.crc32(payload) & 0xFFFFFFFF))
+        self._file.write(payload)
+        self._file.flush()
+        self._frames += 1
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def discard(self):
+        """Stops journaling and removes the save along with the journal."""
+        self.close()
+        for path in (self.path, self.path + JOURNAL_SUFFIX):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _track(self, game):
+        stage = game.stage
+        if stage is not self._stage:
+            stage.map.add_listener(self._tile_changed)
+            stage.map.add_visibility_listener(self._cell_seen)
+            self._stage = stage
+        self._actors, self._items = _journaled_objects(game)
+        self._ids = dict((id(actor), i) for i, actor in enumerate(self._actors))
+        self._actor_states = [_actor_state(actor) for actor in self._actors]
+        self._behaviors = [_behavior_state(actor, self._ids) for actor in self._actors]
+        self._behavior_objects = [_behavior_of(actor) for actor in self._actors]
+        held = set(map(id, game.player.inventory))
+        on_stage = set(map(id, stage.items))
+        self._item_states = [_item_state(item, held, on_stage) for item in self._items]
+        self._explored = bytearray(stage.map.explored)
+        self._changed_tiles.clear()
+        self._seen_cells.clear()
+        self._corpses = len(stage.corpses)
+        self._last_message = game.log.messages[-1] if game.log.messages else None
+        self._last_count = self._last_message.count if self._last_message else 0
+
+    def _untracked(self, game):
+        """Whether there are actors or items the snapshot doesn't know."""
+        ids = self._ids
+        for actor in game.stage.actors:
+            if id(actor) not in ids:
+                return True
+        known = set(map(id, self._items))
+        for item in chain(game.stage.items, game.player.inventory):
+            if id(item) not in known:
+                return True
+        return False
+
+    def _tile_changed(self, x, y):
+        self._changed_tiles.add((x, y))
+
+    def _cell_seen(self, x, y):
+        self._seen_cells.add((x, y))
+
+    def _record_tiles(self, writer, game_map):
+        for x, y in self._changed_tiles:
+            writer.pack(_RECORD, _RECORD_TILE)
+            writer.pack(_TILE, x, y, game_map.types[game_map.index(x, y)])
+        self._changed_tiles.clear()
+
+        explored = self._explored
+        for x, y in self._seen_cells:
+            i = game_map.index(x, y)
+            if game_map.explored[i] and not explored[i]:
+                explored[i] = 1
+                writer.pack(_RECORD, _RECORD_EXPLORED)
+                writer.pack(_CELL, x, y)
+        self._seen_cells.clear()
+
+    def _record_actors(self, writer, stage):
+        present = set(map(id, stage.actors))
+        energies = array('b')
+        for i, actor in enumerate(self._actors):
+            if self._actor_states[i] is None:
+                energies.append(0)
+                continue
+            if id(actor) not in present:
+                writer.pack(_RECORD, _RECORD_ACTOR_GONE)
+                writer.pack(_ID, i)
+                self._actor_states[i] = None
+                energies.append(0)
+                continue
+            energies.append(actor.energy.energy)
+            state = _actor_state(actor)
+            if state != self._actor_states[i]:
+                writer.pack(_RECORD, _RECORD_ACTOR)
+                writer.pack(_ID, i)
+                writer.raw(state)
+                self._actor_states[i] = state
+            # Behaviors are replaced rather than changed, except for the
+            # turns a confused monster has left
+            behavior = _behavior_of(actor)
+            if behavior is not self._behavior_objects[i] or isinstance(behavior, Confused):
+                self._behavior_objects[i] = behavior
+                state = _behavior_state(actor, self._ids)
+                if state != self._behaviors[i]:
+                    writer.pack(_RECORD, _RECORD_BEHAVIOR)
+                    writer.pack(_ID, i)
+                    writer.raw(state)
+                    self._behaviors[i] = state
+        # Everyone's energy changes every turn, so it is written as a whole,
+        # at a byte per actor
+        writer.pack(_RECORD, _RECORD_ENERGY)
+        writer.raw(energies.tostring())
+
+    def _record_items(self, writer, game):
+        held = set(map(id, game.player.inventory))
+        on_stage = set(map(id, game.stage.items))
+        for i, item in enumerate(self._items):
+            if self._item_states[i][0] == _ITEM_GONE:
+                continue
+            state = _item_state(item, held, on_stage)
+            if state != self._item_states[i]:
+                writer.pack(_RECORD, _RECORD_ITEM)
+                writer.pack(_ID, i)
+                writer.pack(_ITEM_STATE, *state)
+                self._item_states[i] = state
+
+    def _record_messages(self, writer, messages):
+        # Messages are only ever added (and dropped from the front), so the
+        # new ones are those after the last one written
+        start = 0
+        for i in range(len(messages) - 1, -1, -1):
+            if messages[i] is self._last_message:
+                start = i + 1
+                if messages[i].count != self._last_count:
+                    writer.pack(_RECORD, _RECORD_REPEAT)
+                    writer.pack(_COUNT, messages[i].count)
+                break
+        for message in messages[start:]:
+            writer.pack(_RECORD, _RECORD_MESSAGE)
+            _write_message(writer, message)
+        if messages:
+            self._last_message = messages[-1]
+            self._last_count = messages[-1].count
+
+
+def _journaled_objects(game):
+    """Returns the actors and items of the game, in the order the journal
+    identifies them by."""
+    return list(game.stage.actors), list(game.stage.items) + list(game.player.inventory)
+
+
+def _actor_state(actor):
+    return _ACTOR_STATE.pack(actor.pos.x, actor.pos.y, actor.hp, actor.base_max_hp,
+                             actor.base_defense, actor.base_power, actor.xp, actor.level)
+
+
+def _behavior_of(actor):
+    return None if isinstance(actor, Hero) else actor.ai.behavior
+
+
+def _behavior_state(actor, indexes):
+    if isinstance(actor, Hero):
+        return None
+    writer = _Writer()
+    _write_behavior(writer, actor.ai.behavior, indexes)
+    return writer.getvalue()
+
+
+def _item_state(item, held, on_stage):
+    if id(item) in held:
+        return _ITEM_HELD, 0, 0, item.is_equipped
+    elif id(item) in on_stage:
+        return _ITEM_ON_STAGE, item.pos.x, item.pos.y, item.is_equipped
+    return _ITEM_GONE, 0, 0, False
+
+
+def _replay(game, path, crc):
+    """Applies the frames of the journal at path to the game, if it was
+    written on top of the save with the given CRC. Stops at the first frame
+    that is incomplete or damaged."""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except IOError:
+        return
+    if len(data) < _JOURNAL_HEADER.size:
+        return
+    magic, version, save_crc = _JOURNAL_HEADER.unpack_from(data)
+    if magic != JOURNAL_MAGIC or version != FORMAT_VERSION or save_crc != crc:
+        return
+
+    actors, items = _journaled_objects(game)
+    offset = _JOURNAL_HEADER.size
+    while offset + _FRAME.size <= len(data):
+        size, frame_crc = _FRAME.unpack_from(data, offset)
+        payload = data[offset + _FRAME.size:offset + _FRAME.size + size]
+        if len(payload) < size or zlib.crc32(payload) & 0xFFFFFFFF != frame_crc:
+            break
+        _apply_frame(game, _Reader(payload), actors, items)
+        offset += _FRAME.size + size
+
+    stage = game.stage
+    if stage.turn_queue:
+        stage.turn_queue = EnergyQueue(stage.actors)
+    stage.map.refresh_visibility(game.player.pos)
+
+
+def _apply_frame(game, reader, actors, items):
+    stage = game.stage
+    game_map = stage.map
+    hero = game.player
+    turn, current_actor_index = reader.unpack(_TURN)
+    while not reader.at_end():
+        record, = reader.unpack(_RECORD)
+        if record == _RECORD_TILE:
+            x, y, type_id = reader.unpack(_TILE)
+            game_map.set_tile_type_at(x, y, Tile.TYPES[type_id])
+        elif record == _RECORD_EXPLORED:
+            x, y = reader.unpack(_CELL)
+            game_map.mark_explored(x, y)
+        elif record == _RECORD_ACTOR:
+            i, = reader.unpack(_ID)
+            actor = actors[i]
+            x, y, hp, base_max_hp, base_defense, base_power, xp, level = reader.unpack(_ACTOR_STATE)
+            if (x, y) != (actor.pos.x, actor.pos.y):
+                stage.move_actor(actor, Position(x, y))
+            actor.hp = hp
+            actor.base_max_hp = base_max_hp
+            actor.base_defense = base_defense
+            actor.base_power = base_power
+            actor.xp = xp
+            actor.level = level
+        elif record == _RECORD_ACTOR_GONE:
+            i, = reader.unpack(_ID)
+            stage.remove_actor(actors[i])
+        elif record == _RECORD_BEHAVIOR:
+            i, = reader.unpack(_ID)
+            targets = []
+            actors[i].ai.behavior = _read_behavior(reader, targets)
+            for behavior, index in targets:
+                behavior.target = actors[index]
+        elif record == _RECORD_ENERGY:
+            for actor, energy in zip(actors, array('b', reader.raw(len(actors)))):
+                actor.energy.energy = energy
+        elif record == _RECORD_ITEM:
+            i, = reader.unpack(_ID)
+            _move_item(items[i], reader.unpack(_ITEM_STATE), stage, hero)
+        elif record == _RECORD_CORPSE:
+            kind, x, y = reader.unpack(_CORPSE)
+            stage.add_corpse(pyro.engine.corpse.Corpse(pyro.engine.corpse.TYPES[kind],
+                                                       reader.string(), Position(x, y)))
+        elif record == _RECORD_MESSAGE:
+            game.log.messages.append(_read_message(reader))
+            del game.log.messages[:-MSG_HEIGHT]
+        elif record == _RECORD_REPEAT:
+            game.log.messages[-1].count, = reader.unpack(_COUNT)
+        else:
+            raise ValueError('Journal has unknown record {0}'.format(record))
+    game.turn = turn
+    stage.current_actor_index = current_actor_index if current_actor_index < len(stage.actors) else 0
+
+
+def _move_item(item, state, stage, hero):
+    where, x, y, is_equipped = state
+    held = item in hero.inventory
+    if held and where != _ITEM_HELD:
+        hero.inventory.remove(item)
+    elif not held and item in stage.items:
+        stage.remove_item(item)
+    if where == _ITEM_HELD and not held:
+        item.owner = hero
+        hero.inventory.append(item)
+    elif where == _ITEM_ON_STAGE:
+        item.pos.x, item.pos.y = x, y
+        stage.add_item(item)
+    item.is_equipped = bool(is_equipped)
+    hero.equipment_changed()
@@ -27,6 +27,36 @@ CHARACTER_SCREEN_WIDTH = 30
 INVENTORY_WIDTH = 50
 CONTROL_SCREEN_WIDTH = 20
 
+# Turn scheduling: 'round-robin' polls every actor's energy in turn, while
+# 'queue' jumps straight to the next actor that can act
+TURN_SCHEDULER = 'round-robin'
+
+# Game log file: when the PYRO_LOG_FILE environment variable names a file,
+# every message is also appended to it, a batch of messages at a time, and
+# the file is rotated once it grows past the maximum size
+LOG_FILE_VARIABLE = 'PYRO_LOG_FILE'
+LOG_FILE_BATCH = 64
+LOG_FILE_MAX_BYTES = 1024 * 1024
+LOG_FILE_BACKUPS = 3
+
+# Recording: when the PYRO_RECORDING environment variable names a file, each
+# new game's seed and inputs are recorded to it, for pyro.headless --replay
+RECORDING_VARIABLE = 'PYRO_RECORDING'
+
+# Frame metrics: when the PYRO_FRAME_METRICS environment variable names a
+# file, what each frame cost to update and render, its libtcod draw calls and
+# why it was redrawn are written to it, and PYRO_FRAME_OVERLAY, when set,
+# shows them over the screen
+FRAME_METRICS_VARIABLE = 'PYRO_FRAME_METRICS'
+FRAME_OVERLAY_VARIABLE = 'PYRO_FRAME_OVERLAY'
+
+# Saved game: written whenever the hero takes the stairs and on quitting,
+# and removed once the hero dies
+SAVE_FILE = 'savegame.dat'
+# Hero turns journaled on top of the saved game before it is saved in full
+# again
+JOURNAL_COMPACT_TURNS = 200
+
 # Dungeon generation
 ROOM_MAX_SIZE = 10
 ROOM_MIN_SIZE = 6
@@ -0,0 +1,67 @@
+
+
+class SpatialIndex:
+    """Objects that have a pos, hashed by the cell they are on.
+
+    Lookups by cell, radius or rectangle only touch the cells involved, so
+    their cost doesn't depend on how many objects there are in total. The
+    index has to be told whenever one of its objects moves."""
+    def __init__(self, objects=None):
+        self._cells = {}
+        if objects:
+            for obj in objects:
+                self.add(obj)
+
+    def add(self, obj):
+        key = (obj.pos.x, obj.pos.y)
+        cell = self._cells.get(key)
+        if cell is None:
+            self._cells[key] = [obj]
+        else:
+            cell.append(obj)
+
+    def remove(self, obj, position=None):
+        """Removes the object from the cell at position, which defaults to
+        where the object currently is."""
+        if position is None:
+            position = obj.pos
+        key = (position.x, position.y)
+        cell = self._cells[key]
+        cell.remove(obj)
+        if not cell:
+            del self._cells[key]
+
+    def move(self, obj, from_pos):
+        """Re-indexes an object that has moved from from_pos to its pos."""
+        self.remove(obj, from_pos)
+        self.add(obj)
+
+    def at(self, position):
+        return self.at_xy(position.x, position.y)
+
+    def at_xy(self, x, y):
+        return list(self._cells.get((x, y), ()))
+
+    def in_rect(self, x, y, width, height):
+        found = []
+        if width * height > len(self._cells):
+            for (cx, cy), cell in self._cells.iteritems():
+                if x <= cx < x + width and y <= cy < y + height:
+                    found.extend(cell)
+        else:
+            for cy in range(y, y + height):
+                for cx in range(x, x + width):
+                    cell = self._cells.get((cx, cy))
+                    if cell:
+                        found.extend(cell)
+        return found
+
+    def in_radius(self, center, radius):
+        """Returns the objects within radius (inclusive) of center."""
+        extent = int(radius)
+        candidates = self.in_rect(center.x - extent, center.y - extent,
+                                  extent * 2 + 1, extent * 2 + 1)
+        return [obj for obj in candidates if center.distance_to(obj.pos) <= radius]
+
+    def __len__(self):
+        return sum(len(cell) for cell in self._cells.itervalues())
@@ -42,16 +42,15 @@ class FireballAction(LosAction):
     def on_target(self, target):
         self.game.log.elemental('The fireball explodes, burning everything within %d tiles!' %
                                 self._radius, Elements.FIRE)
-        for actor in self.game.stage.actors:
-            if actor.pos.distance_to(target.pos) <= self._radius:
-                self.game.log.elemental('{1} gets burned for %d hit points.' %
-                                        self._damage, Elements.FIRE, actor)
-                actor.take_damage(self, self._damage, self.actor)
+        for actor in self.game.stage.actor_index.in_radius(target.pos, self._radius):
+            self.game.log.elemental('{1} gets burned for %d hit points.' %
+                                    self._damage, Elements.FIRE, actor)
+            actor.take_damage(self, self._damage, self.actor)
 
         # Send events for the UI to render the explosion
         hit_on = [Tile.TYPE_FLOOR, Tile.TYPE_TALL_GRASS, Tile.TYPE_CRUSHED_GRASS]
         for x in range(target.pos.x - self._radius, target.pos.x + self._radius + 1):
             for y in range(target.pos.y - self._radius, target.pos.y + self._radius + 1):
                 if target.pos.distance(x, y) <= self._radius:
-                    if self.game.stage.map.tile_at(x, y).type in hit_on:
+                    if self.game.stage.map.tile_type_at(x, y) in hit_on:
                         self.add_event(Event(Event.TYPE_BOLT, element=Elements.FIRE, position=Position(x, y)))
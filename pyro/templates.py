@@ -0,0 +1,91 @@
+class TemplateRegistry:
+    """Monster or item templates, indexed by id and by type.
+
+    Spawn chances only depend on the dungeon level, so the table for each
+    level (and type) is computed once and shared by every room built on
+    that level. The tables must not be modified.
+
+    Given a compiler, each template is also turned into a factory the
+    first time it is needed, which does the work shared by every instance
+    (e.g. resolving colors) once rather than for every spawn.
+
+    The templates themselves are only loaded, by calling load, when first
+    needed, so that importing doesn't pay for reading them."""
+    def __init__(self, load, compiler=None):
+        self._load = load
+        self._templates = None
+        self._by_id = {}
+        self._by_type = {}
+        self._spawn_chances = {}
+        self._compiler = compiler
+        self._factories = {}
+
+    @property
+    def templates(self):
+        if self._templates is None:
+            self.__index()
+        return self._templates
+
+    def __index(self):
+        templates = self._load()
+        for template in templates:
+            self._by_id[template['id']] = template
+            self._by_type.setdefault(template.get('type'), []).append(template)
+        self._templates = templates
+
+    def __len__(self):
+        return len(self.templates)
+
+    def get(self, template_id):
+        if self._templates is None:
+            self.__index()
+        return self._by_id.get(template_id)
+
+    def factory(self, template_id):
+        """Returns the compiled factory for the template, or None if there is
+        no such template."""
+        factory = self._factories.get(template_id)
+        if factory is None:
+            template = self.get(template_id)
+            if template is None:
+                return None
+            factory = self._compiler(template)
+            self._factories[template_id] = factory
+        return factory
+
+    def of_type(self, type_):
+        if self._templates is None:
+            self.__index()
+        return self._by_type.get(type_, [])
+
+    def spawn_chances(self, dungeon_level, type_=None):
+        """Returns the spawn chance of each template (of the given type) on
+        the dungeon level, by id."""
+        key = (dungeon_level, type_)
+        chances = self._spawn_chances.get(key)
+        if chances is None:
+            templates = self.templates if type_ is None else self.of_type(type_)
+            chances = get_spawn_chances(templates, dungeon_level)
+            self._spawn_chances[key] = chances
+        return chances
+
+
+def from_dungeon_level(table, dungeon_level):
+    # Returns a value that depends on the dungeon level. The table specifies
+    # what value occurs after each level. Default is 0.
+    for (value, level) in reversed(table):
+        if dungeon_level >= level:
+            return value
+    return 0
+
+
+def get_spawn_chances(templates, dungeon_level):
+    chances = {}
+    for t in templates:
+        if 'spawn' in t:
+            chance = t['spawn']
+            if isinstance(chance, list):
+                chances[t['id']] = from_dungeon_level(chance, dungeon_level)
+            else:
+                chances[t['id']] = chance
+    return chances
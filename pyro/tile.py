@@ -6,6 +6,10 @@ from pyro.settings import COLOR_LIGHT_GROUND, COLOR_DARK_GROUND, COLOR_LIGHT_WAL
 
 _Appearance = namedtuple('Appearance', 'lit unlit')
 
+# Every tile type, indexed by its id. Maps store the id of each cell's type
+# rather than the type itself.
+_TILE_TYPES = []
+
 
 class _TileType:
     FLOOR = None
@@ -16,6 +20,7 @@ class _TileType:
     OPEN_DOOR = None
     CLOSED_DOOR = None
     def __init__(self, appearance, passable, transparent, is_exit=False, always_visible=False):
+        self.id = len(_TILE_TYPES)
         self.appearance = appearance
         self.passable = passable
         self.transparent = transparent
@@ -24,6 +29,7 @@ class _TileType:
         self.opens_to = None
         self.closes_to = None
         self.steps_to = None
+        _TILE_TYPES.append(self)
 
 
 def _open_tile(lit, unlit):
@@ -65,14 +71,4 @@ class Tile:
     TYPE_OPEN_DOOR.closes_to = TYPE_CLOSED_DOOR
     TYPE_CLOSED_DOOR.opens_to = TYPE_OPEN_DOOR
 
-    def __init__(self):
-        self.type = Tile.TYPE_WALL
-        self.explored = False
-
-    @property
-    def passable(self):
-        return self.type.passable
-
-    @property
-    def transparent(self):
-        return self.type.transparent
+    TYPES = _TILE_TYPES
@@ -23,7 +23,12 @@ class Effect:
         pass
 
     @abc.abstractmethod
-    def render(self, game, ui):
+    def render(self, game, console):
+        pass
+
+    @abc.abstractmethod
+    def positions(self):
+        """The positions drawn over by the last render."""
         pass
 
 
@@ -41,12 +46,15 @@ class PositionEffect(Effect):
         self._frame += 1
         return self._frame < self.num_frames()
 
-    def render(self, game, ui):
+    def render(self, game, console):
         char = self.char(self._frame)
         color = self.color(self._frame)
         x, y = self._position.x, self._position.y
-        libtcod.console_set_default_foreground(ui.console, color)
-        libtcod.console_put_char(ui.console, x, y, char, libtcod.BKGND_NONE)
+        libtcod.console_set_default_foreground(console, color)
+        libtcod.console_put_char(console, x, y, char, libtcod.BKGND_NONE)
+
+    def positions(self):
+        return [self._position]
 
     @abc.abstractmethod
     def num_frames(self):
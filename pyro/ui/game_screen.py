@@ -1,15 +1,17 @@
 import libtcodpy as libtcod
 from itertools import chain
+from operator import add
 from pyro.ui import Screen
 from pyro.direction import Direction
 from pyro.engine.actions import PickUpAction, WalkAction, CloseDoorAction, UseAction, DropAction
-from pyro.map import make_map
+from pyro.map import descend, pregenerate_next_level
 from pyro.ui.effects import add_effects
 from pyro.ui.menu_screen import MenuScreen
 from pyro.ui.targetscreen import TargetScreen
 from pyro.ui.pausescreen import PauseScreen
 from pyro.settings import *
 from pyro.target import Target, TargetRequire
+from pyro.tile import Tile
 from pyro.utilities import closest_monster
 from pyro.engine.log import LogType
 from pyro.engine.element import Elements
@@ -27,13 +29,81 @@ _MESSAGE_COLORS = {
 }
 
 
+def _cell(glyph, show_char):
+    return glyph.char if show_char and glyph.char else ' ', glyph.fg_color, glyph.bg_color
+
+
+# How a cell of each tile type is drawn when (lit, unlit), indexed by id
+_TILE_CELLS = [(_cell(t.appearance.lit, True), _cell(t.appearance.unlit, t.always_visible))
+               for t in Tile.TYPES]
+
+_UNEXPLORED_CELL = (' ', libtcod.black, libtcod.black)
+
+
+def _cell_tables():
+    """Builds translation tables from a cell key (tile id * 3 + 0 when
+    unexplored, 1 when explored and 2 when in view) to the character and
+    each color channel of the cell, so that whole planes can be converted
+    at once with bytearray.translate."""
+    tables = [bytearray(256) for _ in range(7)]
+    for tile_id, (lit, unlit) in enumerate(_TILE_CELLS):
+        for state, (char, fg_color, bg_color) in enumerate([_UNEXPLORED_CELL, unlit, lit]):
+            key = tile_id * 3 + state
+            values = [ord(char), fg_color.r, fg_color.g, fg_color.b, bg_color.r, bg_color.g, bg_color.b]
+            for table, value in zip(tables, values):
+                table[key] = value
+    return tables
+
+
+_CELL_TABLES = _cell_tables()
+
+# Multiplies each tile id by three, for the cell keys above
+_TRIPLED = bytearray(min(i * 3, 255) for i in range(256))
+
+# Past this share of damaged cells, the map is filled in bulk instead of
+# being redrawn cell by cell
+_BULK_FILL_RATIO = 0.25
+
+
 class GameScreen(Screen):
-    def __init__(self, game):
+    def __init__(self, game, recorder=None, pregenerate=True):
+        """Given a Recorder, every input and selection handled is recorded.
+        Unless told not to, the next dungeon level is generated in the
+        background while this one is played."""
         Screen.__init__(self)
         self.game = game
         self.effects = []
+        self.recorder = recorder
+        self._pregenerate = pregenerate
+        # How many times the game has been updated
+        self.updates = 0
+
+        # The map is drawn into a console of its own that is kept between
+        # frames, so only the cells that changed since need to be redrawn
+        self._console = None
+        self._console_size = None
+        self._stage = None
+        self._watched_map = None
+        self._damaged = set()
+        # The glyph drawn over each cell by the items, corpses and actors in
+        # view, by cell index
+        self._occupants = {}
+        self._effect_cells = []
+
+        if pregenerate:
+            pregenerate_next_level(game)
+
+    def bind(self, ui):
+        Screen.bind(self, ui)
+        self.redraw()
+
+    def redraw(self):
+        """Redraws the whole map on the next render."""
+        self._stage = None
 
     def handle_input(self, input_):
+        if self.recorder:
+            self.recorder.input(self.updates, input_)
         action = None
         if inputs.EXIT == input_:
             self.ui.push(PauseScreen(), tag='game.pause')
@@ -47,7 +117,7 @@ class GameScreen(Screen):
             action = WalkAction(Direction.EAST)
         elif inputs.ENTER == input_:
             pos = self.game.player.pos
-            if self.game.stage.map.tile(pos).type.is_exit:
+            if self.game.stage.map.tile_type(pos).is_exit:
                 self.next_dungeon_level()
         elif inputs.HERO_INFO == input_:
             info = character_info(self.game.player)
@@ -63,14 +133,13 @@ class GameScreen(Screen):
             # Wait; do nothing and let the world continue
             action = WalkAction(Direction.NONE)
         elif inputs.PICKUP == input_:
-            items_at_player = filter(lambda i: i.pos == self.game.player.pos,
-                                     self.game.stage.items)
+            items_at_player = self.game.stage.item_index.at(self.game.player.pos)
             # TODO Handle multiple items better; selection menu?
             if len(items_at_player) > 0:
                 action = PickUpAction(items_at_player[0])
             else:
                 self.game.log.error('There is nothing here.')
-                self.dirty()
+                self.dirty('message')
         elif inputs.INVENTORY == input_:
             # Show the inventory; if an item is selected, use it
             msg = 'Select an item to use it, or any other key to cancel.\n'
@@ -85,6 +154,10 @@ class GameScreen(Screen):
         return True
 
     def activate(self, result=None, tag=None, data=None):
+        # Every screen closed over this one is recorded, even one that has
+        # nothing to return, so that playing back closes it too
+        if self.recorder:
+            self.recorder.result(self.updates, tag, result)
         if result is None:
             return
 
@@ -101,7 +174,7 @@ class GameScreen(Screen):
                     self.game.player.next_action = UseAction(item, Target(nearest))
                 else:
                     self.game.log.error(require.not_found_message)
-                    self.dirty()
+                    self.dirty('message')
             elif TargetRequire.TYPE_SELECT == require.type:
                 self.ui.push(TargetScreen(self, require.range),
                              tag='item.select-target', data=item)
@@ -120,6 +193,13 @@ class GameScreen(Screen):
                 self.game.player.base_defense += LEVEL_UP_STAT_DEFENSE
         elif 'game.pause' == tag:
                 # New Game or Quit was selected; exit and pass along choice
+                if result == 3:
+                    self.save()
+                if self.game.journal:
+                    self.game.journal.close()
+                if self.recorder:
+                    self.recorder.close()
+                self.game.close()
                 self.ui.pop(result)
 
     def update(self):
@@ -128,20 +208,21 @@ class GameScreen(Screen):
                 self._level_up_player()
 
             if len(self.effects) > 0:
-                self.dirty()
+                self.dirty('effects')
 
             result = self.game.update()
+            self.updates += 1
 
             for event in result.events:
                 add_effects(self.effects, event)
 
             if result.needs_refresh():
-                self.dirty()
+                self.dirty('game')
 
         self.effects = filter(lambda e: e.update(self.game), self.effects)
 
     def handle_mouse_move(self, mouse):
-        self.dirty()
+        self.dirty('mouse')
 
     def _level_up_player(self):
         # Only push one level-up screen at a time
@@ -152,7 +233,7 @@ class GameScreen(Screen):
         self.game.player.level_up()
         msg = 'Your battle skills grow stronger! You reached level {}!'
         self.game.log.gain(msg.format(self.game.player.level))
-        self.dirty()
+        self.dirty('level-up')
         options = ['Constitution (+{0} HP, from {1})'.format(LEVEL_UP_STAT_HP, self.game.player.base_max_hp),
                    'Strength (+{0} attack, from {1})'.format(LEVEL_UP_STAT_POWER, self.game.player.base_power),
                    'Agility (+{0} defense, from {1})'.format(LEVEL_UP_STAT_DEFENSE, self.game.player.base_defense)]
@@ -161,55 +242,73 @@ class GameScreen(Screen):
         self.ui.push(level_up_screen, tag='level-up.stat')
 
     def render(self):
-        # TODO is there more to this?
-        # Draw tiles
-        for y in range(self.game.stage.map.height):
-            for x in range(self.game.stage.map.width):
-                tile = self.game.stage.map.tiles[x][y]
-                visible = self.game.stage.map.is_xy_in_fov(x, y)
-                if not visible:
-                    if tile.explored:
-                        glyph = tile.type.appearance.unlit
-                        libtcod.console_set_char_background(self.ui.console, x, y, glyph.bg_color, libtcod.BKGND_SET)
-                        if tile.type.always_visible and glyph.char:
-                            libtcod.console_set_default_foreground(self.ui.console, glyph.fg_color)
-                            libtcod.console_put_char(self.ui.console, x, y, glyph.char, libtcod.BKGND_NONE)
+        stage = self.game.stage
+        game_map = stage.map
+        if stage is not self._stage:
+            self.__reset(stage)
+
+        # Items, then corpses, then actors, so the latter are drawn on top
+        occupants = {}
+        width = game_map.width
+        visible = game_map.visible
+        for item in stage.items:
+            i = item.pos.y * width + item.pos.x
+            if visible[i]:
+                occupants[i] = item.glyph
+        for corpse in stage.corpses:
+            i = corpse.pos.y * width + corpse.pos.x
+            if visible[i]:
+                occupants[i] = corpse.type.glyph
+        for actor in stage.actors:
+            i = actor.pos.y * width + actor.pos.x
+            if visible[i]:
+                occupants[i] = actor.glyph
+        damaged = self._damaged
+        previous = self._occupants
+        for i, glyph in occupants.iteritems():
+            if previous.get(i) != glyph:
+                damaged.add(i)
+        for i in previous:
+            if i not in occupants:
+                damaged.add(i)
+        self._occupants = occupants
+
+        # Restore the cells drawn over by the effects last time
+        damaged.update(self._effect_cells)
+
+        console = self._console
+        if len(damaged) > len(visible) * _BULK_FILL_RATIO:
+            self.__fill(game_map)
+            for i, glyph in occupants.iteritems():
+                libtcod.console_set_default_foreground(console, glyph.fg_color)
+                libtcod.console_put_char(console, i % width, i // width, glyph.char, libtcod.BKGND_NONE)
+        else:
+            types = game_map.types
+            explored = game_map.explored
+            for i in damaged:
+                x, y = i % width, i // width
+                if visible[i]:
+                    char, fg_color, bg_color = _TILE_CELLS[types[i]][0]
+                elif explored[i]:
+                    char, fg_color, bg_color = _TILE_CELLS[types[i]][1]
                 else:
-                    tile.explored = True
-                    glyph = tile.type.appearance.lit
-                    libtcod.console_set_char_background(self.ui.console, x, y, glyph.bg_color, libtcod.BKGND_SET)
-                    if glyph.char:
-                        libtcod.console_set_default_foreground(self.ui.console, glyph.fg_color)
-                        libtcod.console_put_char(self.ui.console, x, y, glyph.char, libtcod.BKGND_NONE)
-
-        # Draw game items
-        for item in self.game.stage.items:
-            if self.game.stage.map.is_in_fov(item.pos):
-                libtcod.console_set_default_foreground(self.ui.console, item.glyph.fg_color)
-                libtcod.console_put_char(self.ui.console, item.pos.x, item.pos.y,
-                                         item.glyph.char, libtcod.BKGND_NONE)
-
-        # Draw corpses
-        for corpse in self.game.stage.corpses:
-            if self.game.stage.map.is_in_fov(corpse.pos):
-                glyph = corpse.type.glyph
-                libtcod.console_set_default_foreground(self.ui.console, glyph.fg_color)
-                libtcod.console_put_char(self.ui.console, corpse.pos.x, corpse.pos.y,
-                                         glyph.char, libtcod.BKGND_NONE)
-
-        # Draw game actors
-        for actor in self.game.stage.actors:
-            if self.game.stage.map.is_in_fov(actor.pos):
-                libtcod.console_set_default_foreground(self.ui.console, actor.glyph.fg_color)
-                libtcod.console_put_char(self.ui.console, actor.pos.x, actor.pos.y,
-                                         actor.glyph.char, libtcod.BKGND_NONE)
+                    char, fg_color, bg_color = _UNEXPLORED_CELL
+                libtcod.console_put_char_ex(console, x, y, char, fg_color, bg_color)
+
+                glyph = occupants.get(i)
+                if glyph:
+                    libtcod.console_set_default_foreground(console, glyph.fg_color)
+                    libtcod.console_put_char(console, x, y, glyph.char, libtcod.BKGND_NONE)
+        damaged.clear()
 
         # Draw effects
+        self._effect_cells = []
         for effect in self.effects:
-            effect.render(self.game, self.ui)
+            effect.render(self.game, console)
+            self._effect_cells.extend(game_map.index(p.x, p.y) for p in effect.positions())
 
         # Blit the contents of the game (non-GUI) console to the root console
-        libtcod.console_blit(self.ui.console, 0, 0, self.game.stage.map.width, self.game.stage.map.height, 0, 0, 0)
+        libtcod.console_blit(console, 0, 0, game_map.width, game_map.height, 0, 0, 0)
 
         # Print game messages, one line at a time
         y = 1
@@ -249,19 +348,61 @@ class GameScreen(Screen):
         # Blit the contents of the GUI panel to the root console
         libtcod.console_blit(self.ui.panel, 0, 0, SCREEN_WIDTH, PANEL_HEIGHT, 0, 0, PANEL_Y)
 
-    def next_dungeon_level(self):
-        # TODO Push all this down into a Game#next_level() method?
-        # Advance to the next level
-        # Heal the player by 50%
-        self.game.log.message('{1} take[s] a moment to rest, and recover strength.', self.game.player)
-        self.game.player.heal(self.game.player.max_hp / 2)
-
-        msg = 'After a rare moment of peace, {1} descend deeper into the heart of the dungeon...'
-        self.game.log.message(msg, self.game.player)
-        self.game.dungeon_level += 1
+    def __reset(self, stage):
+        """Starts over with a blank console for the given stage."""
+        game_map = stage.map
+        size = (game_map.width, game_map.height)
+        if self._console is None or self._console_size != size:
+            if self._console is not None:
+                libtcod.console_delete(self._console)
+            self._console = libtcod.console_new(game_map.width, game_map.height)
+            self._console_size = size
+        else:
+            libtcod.console_clear(self._console)
+        if game_map is not self._watched_map:
+            game_map.add_listener(self.__cell_changed)
+            game_map.add_visibility_listener(self.__cell_changed)
+            self._watched_map = game_map
+        self._stage = stage
+        self._damaged = set(xrange(game_map.width * game_map.height))
+        self._occupants = {}
+        self._effect_cells = []
+
+    def __fill(self, game_map):
+        """Draws the tiles of the whole map with one call per plane."""
+        # Cells in view are always explored, so explored + visible gives the
+        # state part of the key
+        keys = bytearray(game_map.types).translate(_TRIPLED)
+        keys = bytearray(map(add, map(add, keys, game_map.explored), game_map.visible))
+        chars, fg_r, fg_g, fg_b, bg_r, bg_g, bg_b = [keys.translate(t) for t in _CELL_TABLES]
+        libtcod.console_fill_char(self._console, chars)
+        libtcod.console_fill_foreground(self._console, fg_r, fg_g, fg_b)
+        libtcod.console_fill_background(self._console, bg_r, bg_g, bg_b)
+
+    def __cell_changed(self, x, y):
+        self._damaged.add(self.game.stage.map.index(x, y))
 
-        make_map(self.game)
-        self.dirty()
+    def next_dungeon_level(self):
+        descend(self.game)
+        if self._pregenerate:
+            pregenerate_next_level(self.game)
+        self.save()
+        self.dirty('descend')
+
+    def save(self):
+        """Saves the game in full, or makes sure the saved game is gone once
+        the hero is dead (see Hero.on_death). Only games with a journal are
+        saved."""
+        journal = self.game.journal
+        if journal is None:
+            return
+        try:
+            if self.game.player.is_alive():
+                journal.snapshot(self.game)
+            else:
+                journal.discard()
+        except (IOError, OSError):
+            self.game.log.error('The game could not be saved.')
 
 
 def render_ui_bar(panel, x, y, total_width, name, value, maximum, bar_color, back_color):
@@ -290,8 +431,10 @@ def get_names_under_mouse(mouse, game):
 
     # Create a list with the names of all objects at the mouse's coordinates
     # and in FOV
-    names = [obj.name for obj in chain(game.stage.actors, game.stage.items, game.stage.corpses)
-             if obj.pos.equals(x, y) and game.stage.map.is_in_fov(obj.pos)]
+    names = [obj.name for obj in chain(game.stage.actor_index.at_xy(x, y),
+                                       game.stage.item_index.at_xy(x, y),
+                                       game.stage.corpse_index.at_xy(x, y))
+             if game.stage.map.is_in_fov(obj.pos)]
     return ', '.join(names)
 
 
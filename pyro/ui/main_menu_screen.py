@@ -1,42 +1,61 @@
+import os
 import libtcodpy as libtcod
 from pyro import objects
 from pyro.engine.game import Game
 from pyro.map import make_map
+from pyro.recording import Recorder
+from pyro.savegame import Journal, load_game
+from pyro.settings import SAVE_FILE
 from pyro.ui.game_screen import GameScreen
 from pyro.ui.controlscreen import ControlScreen
-from pyro.ui.userinterface import Screen, draw_menu
-
-
-_BACKGROUND_IMAGE = libtcod.image_load('resources/menu_background.png')
+from pyro.ui.userinterface import Screen, draw_menu, menu_background
 
 
 class MainMenuScreen(Screen):
+    def __init__(self, log_file=None, recording=None):
+        """Given the path of a recording, each new game is recorded to it."""
+        Screen.__init__(self)
+        self._log_file = log_file
+        self._recording = recording
+
     def handle_key_press(self, key):
         index = key.ord - ord('a')
         if index == 0:
-            self.ui.push(GameScreen(_new_game()))
+            self._start_new_game()
         elif index == 1:
-            self.ui.push(ControlScreen())
+            game = _continue_game(self._log_file)
+            if game:
+                self.ui.push(GameScreen(game))
         elif index == 2:
+            self.ui.push(ControlScreen())
+        elif index == 3:
             self.ui.pop()
 
     def render(self):
         # Show the image at twice the regular console resolution
-        libtcod.image_blit_2x(_BACKGROUND_IMAGE, 0, 0, 0)
-        draw_menu(self.ui.console, '', ['New Game', 'Controls', 'Quit'], 24)
+        libtcod.image_blit_2x(menu_background(), 0, 0, 0)
+        draw_menu(self.ui.console, '', ['New Game', 'Continue', 'Controls', 'Quit'], 24)
 
     def activate(self, result=None, tag=None, data=None):
         # This index comes from PauseScreen
         if result == 1:
             # New Game
-            self.ui.push(GameScreen(_new_game()))
+            self._start_new_game()
         elif result == 3:
             # Quit
             self.ui.pop()
 
+    def _start_new_game(self):
+        game = _new_game(self._log_file)
+        recorder = Recorder(self._recording, game) if self._recording else None
+        self.ui.push(GameScreen(game, recorder))
+
 
-def _new_game():
-    game = Game(dungeon_level=1)
+def new_game(seed, log_file=None):
+    """Returns a new game, as started from the menu."""
+    game = Game(dungeon_level=1, seed=seed)
+    if log_file:
+        game.log.stream_to(log_file, game)
     player = objects.new_player(game)
     game.player = player
     make_map(game)
@@ -44,3 +63,35 @@ def _new_game():
     game.log.error('Prepare to perish!')
 
     return game
+
+
+def _new_game(log_file=None):
+    # Every game has a seed, so that it can be recorded and played back
+    game = new_game(libtcod.random_get_int(0, 0, 0x7FFFFFFF), log_file)
+    _start_journal(game)
+    return game
+
+
+def _continue_game(log_file=None):
+    """Returns the saved game, or None if there is no usable one."""
+    if not os.path.exists(SAVE_FILE):
+        return None
+    try:
+        game = load_game(SAVE_FILE)
+    except (IOError, ValueError):
+        return None
+    if log_file:
+        game.log.stream_to(log_file, game)
+    _start_journal(game)
+    return game
+
+
+def _start_journal(game):
+    """Keeps the game saved from now on, starting with a full save."""
+    journal = Journal(SAVE_FILE)
+    try:
+        journal.snapshot(game)
+    except (IOError, OSError):
+        game.log.error('The game could not be saved.')
+        return
+    game.journal = journal
@@ -19,9 +19,12 @@ class MenuScreen(Screen):
         # Convert ASCII code to an index; if it corresponds to an option, return it
         index = key.ord - ord('a')
         if 0 <= index < len(self._options):
-            self.ui.pop(MenuSelection(self._options[index], index))
+            self.ui.pop(self.selection(index))
         elif not self._selection_required:
             self.ui.pop()
 
+    def selection(self, index):
+        return MenuSelection(self._options[index], index)
+
     def render(self):
         draw_menu(self.ui.console, self._header, self._options, self._width, self._empty_text)
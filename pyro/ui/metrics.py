@@ -0,0 +1,178 @@
+"""What each frame of the user interface costs.
+
+Given FrameMetrics, UserInterface times every screen's update and render,
+counts the libtcod calls made drawing and notes why it was made dirty. The
+calls are counted by wrapping the libtcodpy functions below for as long as
+the metrics are open, which works because the ui code always looks them up
+on the module; nothing is wrapped otherwise.
+
+Each frame can be written to a stream, as a line of JSON:
+
+    {"frame": 12, "time": 0.05, "update": {"GameScreen": 0.0004},
+     "render": {"GameScreen": 0.003}, "renders": 1,
+     "draw_calls": {"console_blit": 2, ...}, "dirty": {"mouse": 1}}
+
+where time is the whole frame, input and the frame rate limit included,
+and anything rendered on a push or pop since the previous frame counts
+towards this one. The overlay shows the last frame that rendered, in the
+top right corner.
+"""
+import json
+import timeit
+import libtcodpy as libtcod
+from pyro.profiler import Histogram
+from pyro.settings import SCREEN_WIDTH
+
+
+_clock = timeit.default_timer
+
+# The libtcodpy functions that count as draw calls
+DRAW_CALLS = [
+    'console_blit',
+    'console_clear',
+    'console_fill_background',
+    'console_fill_char',
+    'console_fill_foreground',
+    'console_flush',
+    'console_print_ex',
+    'console_print_rect_ex',
+    'console_put_char',
+    'console_put_char_ex',
+    'console_rect',
+    'console_set_char_background',
+    'console_set_default_background',
+    'console_set_default_foreground',
+    'image_blit_2x',
+]
+
+# The stream is flushed every so many frames, so that little is lost if the
+# game dies without closing it
+STREAM_FLUSH_FRAMES = 20
+
+
+class FrameMetrics:
+    def __init__(self, stream=None, overlay=False):
+        """Given the path of a stream, every frame is written to it."""
+        self.overlay = overlay
+        self.frames = 0
+        # Histograms of the frames and of the updates and renders of each
+        # kind of screen; totals of the draw calls and dirty reasons
+        self.frame_times = Histogram()
+        self.updates = {}
+        self.renders = {}
+        self.draw_calls = {}
+        self.dirty_reasons = {}
+        self._stream = open(stream, 'w') if stream else None
+        self._frame = None
+        self._frame_end = None
+        self._last_rendered = None
+        # The widest overlay drawn yet, all of which is drawn over each time
+        self._overlay_width = 0
+        self._counting = True
+        self._originals = {}
+        self.__new_frame()
+        self.__wrap()
+
+    def __new_frame(self):
+        self._frame = dict(update={}, render={}, renders=0, draw_calls={}, dirty={})
+
+    def __wrap(self):
+        for name in DRAW_CALLS:
+            original = getattr(libtcod, name, None)
+            if original is not None:
+                self._originals[name] = original
+                setattr(libtcod, name, self.__counting(name, original))
+
+    def __counting(self, name, original):
+        def call(*args, **kwargs):
+            if self._counting:
+                calls = self._frame['draw_calls']
+                calls[name] = calls.get(name, 0) + 1
+            return original(*args, **kwargs)
+        return call
+
+    def update(self, screen):
+        self.__time('update', self.updates, screen, screen.update)
+
+    def render(self, screen):
+        self.__time('render', self.renders, screen, screen.render)
+
+    def __time(self, kind, histograms, screen, fn):
+        start = _clock()
+        fn()
+        seconds = _clock() - start
+        name = screen.__class__.__name__
+        histogram = histograms.get(name)
+        if histogram is None:
+            histogram = histograms[name] = Histogram()
+        histogram.add(seconds)
+        times = self._frame[kind]
+        times[name] = times.get(name, 0.0) + seconds
+
+    def rendered(self):
+        self._frame['renders'] += 1
+
+    def dirtied(self, reason):
+        reasons = self._frame['dirty']
+        reasons[reason] = reasons.get(reason, 0) + 1
+
+    def end_frame(self):
+        now = _clock()
+        frame = self._frame
+        frame['frame'] = self.frames
+        frame['time'] = now - self._frame_end if self._frame_end is not None else None
+        if frame['time'] is not None:
+            self.frame_times.add(frame['time'])
+        for totals, counts in [(self.draw_calls, frame['draw_calls']),
+                               (self.dirty_reasons, frame['dirty'])]:
+            for key, n in counts.iteritems():
+                totals[key] = totals.get(key, 0) + n
+        if frame['renders']:
+            self._last_rendered = frame
+        if self._stream:
+            self._stream.write(json.dumps(frame, sort_keys=True) + '\n')
+            if self.frames % STREAM_FLUSH_FRAMES == 0:
+                self._stream.flush()
+        self.frames += 1
+        self._frame_end = now
+        self.__new_frame()
+
+    def draw_overlay(self):
+        """Draws the last frame that rendered over the root console, without
+        counting it."""
+        frame = self._last_rendered
+        if not self.overlay or frame is None:
+            return
+        self._counting = False
+        dirty = ' '.join('{0}:{1}'.format(reason, n)
+                         for reason, n in sorted(frame['dirty'].items()))
+        text = 'upd {0:.1f}ms rnd {1:.1f}ms draws {2} {3}'.format(
+            sum(frame['update'].values()) * 1000, sum(frame['render'].values()) * 1000,
+            sum(frame['draw_calls'].values()), dirty)
+        # The root console isn't cleared between frames, so a shorter text
+        # must cover what a longer one left behind
+        self._overlay_width = max(self._overlay_width, len(text))
+        text = text.rjust(self._overlay_width)
+        libtcod.console_set_default_foreground(0, libtcod.yellow)
+        libtcod.console_set_default_background(0, libtcod.black)
+        libtcod.console_print_ex(0, SCREEN_WIDTH - 1, 0, libtcod.BKGND_SET, libtcod.RIGHT, text)
+        self._counting = True
+
+    def summary(self):
+        return dict(
+            frames=self.frames,
+            frame_time=self.frame_times.to_dict(),
+            update=dict((name, h.to_dict()) for name, h in self.updates.iteritems()),
+            render=dict((name, h.to_dict()) for name, h in self.renders.iteritems()),
+            draw_calls=self.draw_calls,
+            dirty=self.dirty_reasons,
+        )
+
+    def close(self):
+        """Puts back the libtcodpy functions and closes the stream."""
+        for name, original in self._originals.iteritems():
+            setattr(libtcod, name, original)
+        self._originals = {}
+        if self._stream:
+            self._stream.close()
+            self._stream = None
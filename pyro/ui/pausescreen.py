@@ -1,11 +1,8 @@
 import libtcodpy as libtcod
-from pyro.ui.userinterface import Screen, draw_menu, Key
+from pyro.ui.userinterface import Screen, draw_menu, menu_background, Key
 from pyro.ui.controlscreen import ControlScreen
 
 
-_BACKGROUND_IMAGE = libtcod.image_load('resources/menu_background.png')
-
-
 class PauseScreen(Screen):
     def handle_key_press(self, key):
         index = key.ord - ord('a')
@@ -23,6 +20,6 @@ class PauseScreen(Screen):
             self.ui.pop(index)
 
     def render(self):
-        libtcod.image_blit_2x(_BACKGROUND_IMAGE, 0, 0, 0)
+        libtcod.image_blit_2x(menu_background(), 0, 0, 0)
         options = ['Continue', 'New Game', 'Controls', 'Quit']
         draw_menu(self.ui.console, '', options, 24)
@@ -39,15 +39,14 @@ class TargetScreen(Screen):
             self.__cancel()
 
     def handle_mouse_move(self, mouse):
-        self.dirty()
+        self.dirty('mouse')
 
     def __cancel(self):
         self._game_screen.game.log.notify('Cancelled')
         self.ui.pop()
 
     def __monster_at(self, pos):
-        for game_object in self._game_screen.game.stage.actors:
+        for game_object in self._game_screen.game.stage.actor_index.at(pos):
             if game_object != self._game_screen.game.player:
-                if game_object.pos == pos:
-                    return game_object
+                return game_object
         return None
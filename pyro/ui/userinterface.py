@@ -9,7 +9,8 @@ from pyro.ui.keys import key_for_int, Key
 #         ui.refresh()
 #         ui.handle_input()
 class UserInterface:
-    def __init__(self):
+    def __init__(self, metrics=None):
+        """Given FrameMetrics, what every frame costs is measured."""
         self.screens = []
         self.keybindings = {}
         self._keyboard = libtcod.Key()
@@ -17,9 +18,14 @@ class UserInterface:
         self.console = libtcod.console_new(MAP_WIDTH, MAP_HEIGHT)
         self.panel = libtcod.console_new(SCREEN_WIDTH, PANEL_HEIGHT)
         self._dirty = True
+        self.metrics = metrics
 
-    def dirty(self):
+    def dirty(self, reason=None):
+        """Has everything rendered again on the next refresh; the reason is
+        only for the metrics."""
         self._dirty = True
+        if self.metrics:
+            self.metrics.dirtied(reason)
 
     def bind_key(self, key, input_):
         self.keybindings[key] = input_
@@ -39,10 +45,16 @@ class UserInterface:
             self.render()
 
     def refresh(self):
+        metrics = self.metrics
         for screen in self.screens:
-            screen.update()
+            if metrics:
+                metrics.update(screen)
+            else:
+                screen.update()
         if self._dirty:
             self.render()
+        if metrics:
+            metrics.end_frame()
 
     def render(self):
         libtcod.console_clear(self.console)
@@ -57,10 +69,17 @@ class UserInterface:
         if index < 0:
             index = 0
 
+        metrics = self.metrics
         while index < len(self.screens):
-            self.screens[index].render()
+            if metrics:
+                metrics.render(self.screens[index])
+            else:
+                self.screens[index].render()
             index += 1
 
+        if metrics:
+            metrics.rendered()
+            metrics.draw_overlay()
         self._dirty = False
         libtcod.console_flush()
 
@@ -71,7 +90,8 @@ class UserInterface:
         self._handle_keypress(screen)
         if self.mouse.lbutton_pressed or self.mouse.rbutton_pressed:
             screen.handle_mouse_click(self.mouse)
-        if self.mouse.dx != 0 or self.mouse.dy != 0:
+        # Only a move to another cell can change what is shown
+        if self.mouse.dcx != 0 or self.mouse.dcy != 0:
             screen.handle_mouse_move(self.mouse)
 
     def top_screen(self):
@@ -132,9 +152,9 @@ class Screen:
     def render(self):
         pass
 
-    def dirty(self):
+    def dirty(self, reason=None):
         if self.ui:
-            self.ui.dirty()
+            self.ui.dirty(reason)
 
     def handle_input(self, input_):
         return False
@@ -149,6 +169,17 @@ class Screen:
         pass
 
 
+_menu_background = None
+
+
+def menu_background():
+    """The background image of the menus, loaded when first shown."""
+    global _menu_background
+    if _menu_background is None:
+        _menu_background = libtcod.image_load('resources/menu_background.png')
+    return _menu_background
+
+
 # TODO This seems inappropriate in this userinterface module.
 # Where should this function live?
 def draw_menu(console, header, options, width,
@@ -1,7 +1,9 @@
 
 
 def blocked(game, position):
-    return is_blocked(game.stage.map, game.stage.actors, position)
+    if game.stage.map.movement_blocked(position.x, position.y):
+        return True
+    return game.stage.actor_at(position) is not None
 
 
 def is_blocked(game_map, actors, position):
@@ -22,7 +24,8 @@ def closest_monster(game, max_range):
     closest_enemy = None
     closest_dist = max_range + 1
 
-    for game_object in game.stage.actors:
+    # Anything nearer than max_range + 1 is in range, not just max_range
+    for game_object in game.stage.actor_index.in_radius(game.player.pos, closest_dist):
         if game_object != game.player:
             if game.stage.map.is_in_fov(game_object.pos):
                 # Calculate distance between this object and the player
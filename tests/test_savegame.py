@@ -0,0 +1,158 @@
+import os
+import shutil
+import tempfile
+import unittest
+import libtcodpy as libtcod
+from pyro import savegame
+from pyro.direction import Direction
+from pyro.engine.actions import WalkAction
+from pyro.engine.ai import Aggressive, Confused
+from pyro.engine.game import Game
+from pyro.headless import Simulation
+
+
+def _play(seed, turns):
+    """Returns a Simulation that played the turns, stopped right at the end
+    of a hero turn."""
+    simulation = Simulation(seed=seed)
+    game = simulation.game
+    game.player.hp = game.player.base_max_hp = 10 ** 6
+    simulation.run(turns)
+    _finish_turn(game)
+    return simulation
+
+
+def _finish_turn(game):
+    """Has the hero rest, and stops where the turn ends: where a journal
+    records it and where the random generator is reseeded."""
+    turn = game.turn
+    game.player.next_action = WalkAction(Direction.NONE)
+    while game.turn == turn:
+        game.update()
+
+
+def _draws(game):
+    return [libtcod.random_get_int(game.rng, 0, 1000) for _ in range(10)]
+
+
+class SaveTest(unittest.TestCase):
+    def test_round_trip(self):
+        for seed in (1, 2, 3):
+            game = _play(seed, 60).game
+            data = savegame.dumps(game)
+            self.assertEqual(savegame.dumps(savegame.loads(data)), data)
+
+    def test_round_trip_confused_chain(self):
+        game = _play(4, 10).game
+        monsters = [actor for actor in game.stage.actors if actor is not game.player]
+        first, second = monsters[:2]
+        first.ai.behavior = Confused(Confused(Aggressive(target=second), 3), 2)
+        second.ai.behavior = Confused(None, -4)
+        data = savegame.dumps(game)
+
+        loaded = savegame.loads(data)
+        self.assertEqual(savegame.dumps(loaded), data)
+        index = game.stage.actors.index(first)
+        behavior = loaded.stage.actors[index].ai.behavior
+        self.assertEqual(behavior.num_turns, 2)
+        self.assertEqual(behavior.restore_ai.num_turns, 3)
+        target = behavior.restore_ai.restore_ai.target
+        self.assertIs(target, loaded.stage.actors[game.stage.actors.index(second)])
+
+    def test_random_generator_resumes(self):
+        game = _play(5, 40).game
+        loaded = savegame.loads(savegame.dumps(game))
+        fresh = Game(game.dungeon_level, game.seed)
+        expected = _draws(game)
+        self.assertEqual(_draws(loaded), expected)
+        self.assertNotEqual(_draws(fresh), expected)
+
+    def test_not_a_save(self):
+        data = savegame.dumps(_play(6, 5).game)
+        for bad in ('', 'PYRO', 'JUNK' + data[4:], data[:40]):
+            self.assertRaises(ValueError, savegame.loads, bad)
+
+
+class JournalTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'save.dat')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _journaled(self, seed):
+        simulation = _play(seed, 5)
+        journal = savegame.Journal(self.path)
+        journal.snapshot(simulation.game)
+        simulation.game.journal = journal
+        return simulation
+
+    def test_replay(self):
+        for seed in (1, 2, 3):
+            simulation = self._journaled(seed)
+            game = simulation.game
+            monsters = [actor for actor in game.stage.actors if actor is not game.player]
+            monsters[0].ai.behavior = Confused(Confused(Aggressive(target=monsters[1]), 3), 2)
+            for _ in range(4):
+                simulation.run(15)
+                _finish_turn(game)
+                loaded = savegame.load_game(self.path)
+                self.assertEqual(savegame.dumps(loaded), savegame.dumps(game))
+                self.assertEqual(_draws(loaded), _draws(game))
+            game.journal.close()
+
+    def test_damaged_frame(self):
+        simulation = self._journaled(7)
+        game = simulation.game
+        simulation.run(10)
+        _finish_turn(game)
+        before = savegame.dumps(game)
+        journal_file = self.path + savegame.JOURNAL_SUFFIX
+        size = os.path.getsize(journal_file)
+        simulation.run(1)
+        _finish_turn(game)
+        game.journal.close()
+
+        # A frame that fails its CRC, and everything after it, is ignored
+        with open(journal_file, 'r+b') as f:
+            f.seek(size + savegame._FRAME.size)
+            byte = f.read(1)
+            f.seek(size + savegame._FRAME.size)
+            f.write(chr(ord(byte) ^ 0xFF))
+        self.assertEqual(savegame.dumps(savegame.load_game(self.path)), before)
+
+    def test_death_discards_save(self):
+        simulation = self._journaled(9)
+        game = simulation.game
+        game.player.hp = 1
+        while game.player.is_alive():
+            simulation.run(1)
+        self.assertFalse(os.path.exists(self.path))
+        self.assertFalse(os.path.exists(self.path + savegame.JOURNAL_SUFFIX))
+
+    def test_failed_save(self):
+        # The file can't be replaced by anything while it is a directory
+        os.makedirs(os.path.join(self.path, 'in the way'))
+        game = _play(10, 5).game
+        self.assertRaises(OSError, savegame.save_game, game, self.path)
+        self.assertEqual(os.listdir(self.directory), ['save.dat'])
+
+    def test_journal_of_another_save(self):
+        simulation = self._journaled(8)
+        game = simulation.game
+        other = savegame.loads(savegame.dumps(game))
+        other.player.hp -= 1
+        simulation.run(10)
+        _finish_turn(game)
+        game.journal.close()
+
+        # A save rewritten without its journal doesn't replay the old one
+        savegame.save_game(other, self.path)
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        self.assertEqual(savegame.dumps(savegame.load_game(self.path)), data)
+
+
+if __name__ == '__main__':
+    unittest.main()
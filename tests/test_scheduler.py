@@ -0,0 +1,71 @@
+import unittest
+from pyro.energy import Energy
+from pyro.engine.game import Stage
+from pyro.engine.scheduler import EnergyQueue
+from pyro.position import Position
+
+
+class _Actor:
+    def __init__(self, name, speed, x):
+        self.name = name
+        self.energy = Energy()
+        self.pos = Position(x, 0)
+        self._speed = speed
+
+    def speed(self):
+        return self._speed
+
+
+def _turns(queue, turns, remove_current=(), remove_other=()):
+    """Returns the names of the actors in the order they took their turns,
+    driving the stage like Game.update does. The actor taking the nth turn
+    is removed during it if n is in remove_current, and the first actor
+    other than it if n is in remove_other."""
+    actors = [_Actor('a', 3, 0), _Actor('b', 4, 1), _Actor('c', 2, 2),
+              _Actor('d', 5, 3), _Actor('e', 3, 4), _Actor('f', 1, 5)]
+    stage = Stage(actors=actors)
+    stage.turn_queue = EnergyQueue(stage.actors) if queue else None
+    order = []
+    while len(order) < turns and stage.actors:
+        actor = stage.current_actor()
+        if actor.energy.can_take_turn() or actor.energy.gain(actor.speed()):
+            actor.energy.spend()
+            order.append(actor.name)
+            if len(order) in remove_current:
+                stage.remove_actor(actor)
+            if len(order) in remove_other:
+                stage.remove_actor([a for a in stage.actors if a is not actor][0])
+        stage.advance_actor()
+    return ''.join(order)
+
+
+class EnergyQueueTest(unittest.TestCase):
+    """The queue must give the same turns as the round-robin loop."""
+    def assertSameTurns(self, **kwargs):
+        self.assertEqual(_turns(False, 80, **kwargs), _turns(True, 80, **kwargs))
+
+    def test_turn_order(self):
+        self.assertSameTurns()
+
+    def test_remove_other_actor(self):
+        self.assertSameTurns(remove_other=(4, 11))
+
+    def test_remove_current_actor(self):
+        for turn in range(1, 12):
+            self.assertSameTurns(remove_current=(turn,))
+
+    def test_remove_several_current_actors(self):
+        self.assertSameTurns(remove_current=(3, 17))
+        self.assertSameTurns(remove_current=(9, 10))
+
+    def test_remove_current_actor_keeps_other_turns(self):
+        # Every other actor takes its turns just as if the removed one had
+        # never been there
+        removed = _turns(True, 60, remove_current=(5,))
+        self.assertEqual(removed.count('e'), 1)
+        others = _turns(True, 80).replace('e', '')
+        self.assertEqual(removed.replace('e', ''), others[:len(removed) - 1])
+
+
+if __name__ == '__main__':
+    unittest.main()